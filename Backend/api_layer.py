@@ -1,68 +1,127 @@
-from fastapi import FastAPI, Path, Body
-from typing import List, Dict, Union
+from fastapi import FastAPI, Path, Body, Query, Response
+from pydantic import TypeAdapter
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
 import traceback
 
 from Common.schemas.text_chunk import TextChunk
 from Common.schemas.library import Library
 
 from data.library_data_manager import LibraryDataManager
+from utils.metrics import REGISTRY, timed
 
 from Common.api_requests.query_request import QueryRequest
+from Common.api_requests.batch_query_request import BatchQueryRequest
 
 app = FastAPI()
 
 # Data Managers
 library_manager = LibraryDataManager()
 
+# Routes are async and hand their work to executors, so the event loop never blocks on encoding, indexing or SQLite.
+# Reads (searches, listings) share a wide pool; mutations are serialized on one ingest worker, so ingest never occupies search threads.
+read_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="read")
+write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+
+async def run_on(pool : ThreadPoolExecutor, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(pool, partial(func, *args))
+
+# Listings leave embeddings out unless asked for; they dominate the payload size.
+LIBRARY_EMBEDDINGS = {"documents": {"__all__": {"chunks": {"__all__": {"embeddings"}}}}}
+library_adapter = TypeAdapter(Library)
+libraries_adapter = TypeAdapter(List[Library])
+chunks_adapter = TypeAdapter(List[TextChunk])
+
+def json_response(adapter : TypeAdapter, value, exclude = None, next_cursor : Optional[str] = None) -> Response:
+    # Serializes the models directly, skipping FastAPI's re-validation against response_model.
+    # The manager materializes models from its columnar store under its read lock, so they can be serialized without it.
+    with timed("serialize"):
+        content = adapter.dump_json(value, exclude=exclude)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(content=content, media_type="application/json", headers=headers)
+
 # --- API Routes ---
 
 @app.post("/libraries", response_model=Library)
-def create_library(library: Library):
-    print(f"Added new library with name {library.metadata["name"]}")
-    return library_manager.add_new_library(library)
+async def create_library(library: Library):
+    return await run_on(write_pool, library_manager.add_new_library, library)
 
 @app.get("/libraries/{library_id}", response_model=Library)
-def get_library_by_id(library_id: str = Path(..., description="ID of the library to retrieve")):
-    return library_manager.get_library(library_id)
+async def get_library_by_id(
+    library_id: str = Path(..., description="ID of the library to retrieve"),
+    include_embeddings: bool = Query(False, description="Include every chunk's embeddings")
+):
+    library = await run_on(read_pool, library_manager.get_library, library_id, include_embeddings)
+    return await run_on(read_pool, json_response, library_adapter, library, None if include_embeddings else LIBRARY_EMBEDDINGS)
 
 @app.get("/libraries", response_model=List[Library])
-def get_library():
-    return library_manager.get_all_libraries()
+async def get_library(
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of libraries to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    include_embeddings: bool = Query(False, description="Include every chunk's embeddings")
+):
+    libraries, next_cursor = await run_on(read_pool, library_manager.get_libraries_page, limit, cursor, include_embeddings)
+    return await run_on(read_pool, json_response, libraries_adapter, libraries, None if include_embeddings else {"__all__": LIBRARY_EMBEDDINGS}, next_cursor)
 
 @app.put("/libraries/{library_id}", response_model=Library)
-def update_library(updated_library: Library):
-    return library_manager.update_library(updated_library)
+async def update_library(updated_library: Library):
+    return await run_on(write_pool, library_manager.update_library, updated_library)
 
 @app.delete("/libraries/{library_id}", response_model=Dict[str, str])
-def delete_library(library_id: str):
-    return library_manager.delete_library(library_id)
+async def delete_library(library_id: str):
+    return await run_on(write_pool, library_manager.delete_library, library_id)
 
 @app.post("/libraries/{library_id}/{document_id}/chunks", response_model=bool)
-def add_chunk_to_library(library_id: str, document_id : str, chunk: TextChunk):
-    return library_manager.add_chunk(library_id, document_id, chunk)
+async def add_chunk_to_library(library_id: str, document_id : str, chunk: TextChunk):
+    return await run_on(write_pool, library_manager.add_chunk, library_id, document_id, chunk)
 
 @app.put("/libraries/{library_id}/{document_id}/chunks/{chunk_id}", response_model=bool)
-def update_chunk(library_id : str, document_id : str, chunk_id : str, chunk :TextChunk):
+async def update_chunk(library_id : str, document_id : str, chunk_id : str, chunk :TextChunk):
     try:
-        library_manager.update_chunk(library_id, document_id, chunk_id, chunk)
+        await run_on(write_pool, library_manager.update_chunk, library_id, document_id, chunk_id, chunk)
         return True
     except:
         print(f"API failed with exception: {traceback.extract_stack()}")
         return False
 
 @app.delete("/libraries/{library_id}/chunks/{chunk_id}")
-def delete_chunk_from_library(library_id: str, chunk_id: str):
-    return library_manager.delete_chunk(library_id, chunk_id)
-
-@app.get("/libraries/{library_id}", response_model = List[TextChunk])
-def get_chunks(library_id : str):
-    return library_manager.get_chunks(library_id)
+async def delete_chunk_from_library(library_id: str, chunk_id: str):
+    return await run_on(write_pool, library_manager.delete_chunk, library_id, chunk_id)
+
+@app.get("/libraries/{library_id}/chunks", response_model = List[TextChunk])
+async def get_chunks(
+    library_id : str,
+    limit: int = Query(500, ge=1, le=5000, description="Maximum number of chunks to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    include_embeddings: bool = Query(False, description="Include each chunk's embeddings")
+):
+    chunks, next_cursor = await run_on(read_pool, library_manager.get_chunks_page, library_id, limit, cursor, include_embeddings)
+    return await run_on(read_pool, json_response, chunks_adapter, chunks, None if include_embeddings else {"__all__": {"embeddings"}}, next_cursor)
+
+@app.post("/libraries/search", response_model=List[Dict[str, Any]])
+async def search_chunks_from_text(
+    request: QueryRequest = Body(...)
+) -> List[Dict[str, Any]]:
+    return await run_on(read_pool, library_manager.search_chunk_from_text, request)
 
-@app.post("/libraries/search", response_model=List[Dict[str, Union[TextChunk, float]]])
-def search_chunks_from_text(
+@app.post("/libraries/search/keyword", response_model=List[Dict[str, Any]])
+async def search_chunks_from_keywords(
     request: QueryRequest = Body(...)
-) -> List[Dict[str, Union[TextChunk, float]]]:  
-    return library_manager.search_chunk_from_text(request)
+) -> List[Dict[str, Any]]:
+    return await run_on(read_pool, library_manager.search_chunk_from_keywords, request)
+
+@app.post("/libraries/search/batch", response_model=List[List[Dict[str, Any]]])
+async def search_chunks_batch(
+    request: BatchQueryRequest = Body(...)
+) -> List[List[Dict[str, Any]]]:
+    return await run_on(read_pool, library_manager.search_batch, request)
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text exposition: per-stage latency histograms, LSH bucket and candidate sizes, cache and encoder counters.
+    return Response(content=await run_on(read_pool, REGISTRY.render), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == '__main__':
     library_manager.test_insert()
\ No newline at end of file
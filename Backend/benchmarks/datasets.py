@@ -0,0 +1,70 @@
+from typing import Optional
+from pathlib import Path
+import sqlite3
+import numpy as np
+
+from database.database_obj import DB
+from utils.embedding_codec import decode_embedding
+
+class Corpus:
+    """
+    Benchmark vectors plus held-out query vectors that are not part of the indexed corpus.
+    """
+    def __init__(self, name : str, vectors : np.ndarray, queries : np.ndarray):
+        self.name = name
+        self.vectors = vectors # (n, dim) float32.
+        self.queries = queries # (num_queries, dim) float32.
+
+    @property
+    def size(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+def synthetic_corpus(size : int, dim : int = 384, num_queries : int = 200, num_clusters : int = 100, spread : float = 0.35, seed : int = 0) -> Corpus:
+    '''
+    Gaussian mixture around num_clusters random centres, so neighbourhoods have the clustered structure of real
+    sentence embeddings rather than the uniform noise every ANN index handles poorly. Queries come from the same mixture.
+    '''
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((num_clusters, dim), dtype=np.float32)
+
+    def sample(count : int) -> np.ndarray:
+        points = centres[rng.integers(0, num_clusters, count)]
+        points += spread * rng.standard_normal((count, dim), dtype=np.float32)
+        return points
+
+    return Corpus(f"synthetic-{dim}d", sample(size), sample(num_queries))
+
+def stored_corpus(path : str, num_queries : int = 200, seed : int = 0, page_size : int = 5000) -> Corpus:
+    '''
+    Loads previously computed embeddings, so real corpora can be benchmarked without the network or the encoder.
+    Accepts a .npy matrix or a vector DB SQLite file (every chunk's stored embedding), which is opened read-only and never modified.
+    A seeded sample of num_queries rows is held out of the corpus as queries.
+    '''
+    if path.endswith(".npy"):
+        vectors = np.load(path).astype(np.float32, copy=False)
+    else:
+        # Not DB(path): that would switch the file to WAL and create or migrate tables.
+        conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(Path(DB.construct_sql_path("sql/procs", "pr_select_all_chunks.sql")).read_text())
+            embeddings = []
+            while rows := cursor.fetchmany(page_size):
+                embeddings.extend(decode_embedding(row[3]) for row in rows)
+            vectors = np.array(embeddings, dtype=np.float32)
+        finally:
+            conn.close()
+
+    if vectors.ndim != 2 or vectors.shape[0] <= num_queries:
+        raise ValueError(f"{path} holds {vectors.shape[0] if vectors.ndim == 2 else 0} embeddings; more than num_queries ({num_queries}) are needed.")
+    order = np.random.default_rng(seed).permutation(vectors.shape[0])
+    return Corpus(path, vectors[order[num_queries:]], vectors[order[:num_queries]])
+
+def subset(corpus : Corpus, size : Optional[int]) -> Corpus:
+    # The first size vectors, keeping the same queries, so every size of one run is measured against the same workload.
+    if size is None or size >= corpus.size:
+        return corpus
+    return Corpus(corpus.name, corpus.vectors[:size], corpus.queries)
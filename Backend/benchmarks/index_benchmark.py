@@ -0,0 +1,163 @@
+from typing import List, Dict, Any, Optional
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import time
+import numpy as np
+
+from benchmarks.datasets import Corpus, synthetic_corpus, stored_corpus, subset
+from data.library_store import LibraryStore
+from indexing.index_handler import IndexHandler
+from indexing.lsh_index import LSHIndex
+from indexing.embedding_store import EmbeddingStore
+from indexing.flat_index import FlatIndex
+from utils.mathUtils import normalize_rows
+
+from Common.api_requests.query_request import QueryRequest
+
+ENGINES = ["lsh", "hnsw", "ivfpq", "flat"]
+
+def rss_bytes() -> int:
+    '''
+    Current resident set size. Falls back to the peak RSS where /proc is unavailable.
+    '''
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == "Darwin" else peak * 1024 # Bytes on macOS, KiB elsewhere.
+
+def build_library(corpus : Corpus, engine : str, doc_size : int = 1000) -> LibraryStore:
+    # Libraries are built the way the startup loader builds them, as a columnar store.
+    library = LibraryStore(f"bench-{engine}", {}, engine, corpus.size)
+    for start in range(0, corpus.size, doc_size):
+        doc_id = f"doc-{start // doc_size}"
+        library.add_document(doc_id, {})
+        for i in range(start, min(start + doc_size, corpus.size)):
+            library.set_chunk(doc_id, str(i), "", corpus.vectors[i], {})
+    return library
+
+def ground_truth(corpus : Corpus, k : int) -> List[List[str]]:
+    '''
+    Exact top-k chunk ids of every query, from a flat scan of the whole corpus.
+    '''
+    store = EmbeddingStore(corpus.dim, initial_capacity=corpus.size)
+    for i, vector in enumerate(corpus.vectors):
+        store.add("", str(i), vector)
+    return [[chunk_id for _, chunk_id, _ in found] for found in FlatIndex(store).search_batch(normalize_rows(corpus.queries), k)]
+
+def percentiles(samples : List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+    }
+
+def benchmark_engine(corpus : Corpus, engine : str, truth : List[List[str]], k : int, params : Dict[str, Any], search_options : Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Indexes the corpus with one engine, then times every query and scores it against the exact results.
+    '''
+    library = build_library(corpus, engine)
+    gc.collect()
+    rss_before = rss_bytes()
+
+    # The flat fallback is disabled so empty LSH buckets count against LSH recall instead of being answered exactly.
+    handler = IndexHandler(None, hnsw_params=params if engine == "hnsw" else None, ivfpq_params=params if engine == "ivfpq" else None, flat_fallback=False)
+    if engine == "lsh":
+        handler.lsh = LSHIndex(registry=handler.registry, **params)
+
+    start = time.perf_counter()
+    handler.index_library(library)
+    build_seconds = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    request = QueryRequest(query="", top_k=k, **search_options)
+    latencies = []
+    recalls = []
+    for query, expected in zip(corpus.queries, truth):
+        start = time.perf_counter()
+        found = handler.search(query, request)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({chunk_id for (_, _, chunk_id), _ in found}.intersection(expected)) / max(len(expected), 1))
+
+    return {
+        "corpus": corpus.name,
+        "size": corpus.size,
+        "dim": corpus.dim,
+        "engine": engine,
+        "params": params,
+        "search_options": search_options,
+        "k": k,
+        "queries": len(latencies),
+        f"recall_at_{k}": float(np.mean(recalls)),
+        "latency_ms": percentiles(latencies),
+        "queries_per_second": len(latencies) / sum(latencies),
+        "build_seconds": build_seconds,
+        "ingest_per_second": corpus.size / build_seconds if build_seconds else 0.0,
+        "rss_bytes": rss_after,
+        "index_rss_bytes": rss_after - rss_before, # Growth while indexing: the embedding matrix, the engine and the inverted/metadata maps.
+    }
+
+def run(corpus : Corpus, sizes : List[Optional[int]], engines : List[str], k : int, engine_params : Dict[str, Dict[str, Any]], search_options : Dict[str, Any]) -> List[Dict[str, Any]]:
+    results = []
+    for size in sizes:
+        sized = subset(corpus, size)
+        if size is not None and size > corpus.size:
+            print(f"{corpus.name} holds {corpus.size} vectors; benchmarking that instead of {size}")
+
+        start = time.perf_counter()
+        truth = ground_truth(sized, k)
+        print(f"[{sized.size}] exact ground truth for {len(truth)} queries in {time.perf_counter() - start:.2f}s")
+
+        for engine in engines:
+            result = benchmark_engine(sized, engine, truth, k, engine_params.get(engine, {}), search_options)
+            results.append(result)
+            latency = result["latency_ms"]
+            print(f"[{sized.size}] {engine}: recall@{k} {result[f'recall_at_{k}']:.3f}, p50 {latency['p50']:.2f} ms, p99 {latency['p99']:.2f} ms, "
+                  f"build {result['build_seconds']:.2f}s ({result['ingest_per_second']:.0f}/s), index RSS {result['index_rss_bytes'] / 2**20:.1f} MiB")
+            gc.collect()
+    return results
+
+def main(argv : Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Measures recall@k, query latency, build time and memory of every IndexHandler engine.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000], help="Corpus sizes to benchmark, e.g. 10000 100000 1000000.")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=ENGINES)
+    parser.add_argument("--embeddings", help="Stored embeddings to benchmark (.npy or vector DB SQLite file) instead of a synthetic corpus.")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic corpus: embedding dimension.")
+    parser.add_argument("--clusters", type=int, default=100, help="Synthetic corpus: number of mixture components.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    for engine in ("lsh", "hnsw", "ivfpq"):
+        parser.add_argument(f"--{engine}", type=json.loads, default={}, help=f"JSON constructor parameters for the {engine} index.")
+    parser.add_argument("--search-options", type=json.loads, default={}, help="JSON QueryRequest overrides, e.g. '{\"probe_radius\": 2}'.")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    if args.embeddings:
+        corpus = stored_corpus(args.embeddings, args.queries, args.seed)
+    else:
+        corpus = synthetic_corpus(max(args.sizes), args.dim, args.queries, args.clusters, seed=args.seed)
+    engine_params = {engine: getattr(args, engine) for engine in ("lsh", "hnsw", "ivfpq")}
+    for params in engine_params.values():
+        params.setdefault("seed", args.seed) # Reproducible planes, graphs and codebooks across runs.
+
+    results = run(corpus, sorted(set(args.sizes)), args.engines, args.k, engine_params, args.search_options)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,30 @@
-from typing import Dict, List
+from typing import Dict, List, Any, Optional, Tuple
 from fastapi import HTTPException
-import pickle
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 
 from database.database_obj import DB
 from database.handlers.add_library_handler import AddLibraryHandler
 from database.handlers.add_document_handler import AddDocumentHandler
 from database.handlers.add_chunk_handler import AddChunkHandler
+from database.handlers.load_library_handler import LoadLibraryHandler
+from database.handlers.lsh_state_handler import LSHStateHandler
+from database.handlers.migrate_embeddings_handler import MigrateEmbeddingsHandler
 
-from Common.api_requests.query_request import QueryRequest
+from Common.api_requests.query_request import QueryRequest, SearchOptions
+from Common.api_requests.batch_query_request import BatchQueryRequest
 
+from data.library_store import LibraryStore, ChunkView
 from indexing.index_handler import IndexHandler
 from utils.embedder import SentenceTransformerEmbedder
-from utils.mathUtils import cosine_similarity
-from utils.commonUtils import get_docid_chunk_dict
+from utils.embedding_cache import CachedEmbedder
+from utils.embedding_worker import EmbeddingWorker
+from utils.embedding_codec import encode_embedding
+from utils.commonUtils import get_docid_chunk_dict, project_chunk, paginate
+from utils.fusion import reciprocal_rank_fusion, weighted_score_fusion
+from utils.rwlock import RWLock
+from utils.metrics import REGISTRY, SEARCHES, timed
 
 from Common.schemas.library import Library
 from Common.schemas.document import Document
@@ -25,183 +37,408 @@ class LibraryDataManager:
             cls._instance = super().__new__(cls, *args, **kwargs)
         return cls._instance
     
-    def __init__(self):
-        self.cache : Dict[str, Library] = {}
+    def __init__(self, embed_batch_size : int = 64, embedding_cache_size : int = 10000, persist_embedding_cache : bool = True, embedding_dtype : str = "float32", hybrid_depth : int = 3, query_batch_size : int = 32, query_batch_wait_ms : float = 5.0):
+        self.cache : Dict[str, LibraryStore] = {} # Columnar copy of every library; models are only built for API responses.
+        self.hybrid_depth = hybrid_depth # Hybrid search fetches top_k * hybrid_depth results from each retriever before fusing.
+        self.search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="search") # Runs hybrid search's retrievers concurrently.
+        self.embedding_dtype = embedding_dtype # Precision of stored embedding BLOBs ("float32" or "float16").
+
+        # Searches share the read side of `lock`; mutations take the write side only while they change the cache and indexes.
+        # Mutations are serialized by `mutation_lock`, so their embedding and DB work happens without blocking searches.
+        # Each mutation's DB writes (rows, LSH keys, embedding cache entries) are committed together as one transaction.
+        self.lock = RWLock()
+        self.mutation_lock = threading.Lock()
 
         # DB & DB interaction handler objects.
         self.db = DB()
         self.libraryHandler = AddLibraryHandler(self.db)
         self.documentHandler = AddDocumentHandler(self.db)
-        self.chunkHandler = AddChunkHandler(self.db)
+        self.chunkHandler = AddChunkHandler(self.db, embed_batch_size, embedding_dtype)
+        self.loadHandler = LoadLibraryHandler(self.db)
+        self.lshStateHandler = LSHStateHandler(self.db)
+        self.migrateHandler = MigrateEmbeddingsHandler(self.db, dtype=embedding_dtype)
 
         # Embedding & vector DB indexing handler.
-        self.embedder = SentenceTransformerEmbedder()
+        # Repeated texts (re-embedded chunks, repeated queries) are served from the cache instead of the encoder.
+        # Misses are encoded on a dedicated worker thread, off the request threads. Concurrent queries arriving within
+        # query_batch_wait_ms of each other share one forward pass of up to query_batch_size texts.
+        self.embedding_worker = EmbeddingWorker(SentenceTransformerEmbedder(), query_batch_size, query_batch_wait_ms)
+        self.embedder = CachedEmbedder(self.embedding_worker, embedding_cache_size, self.db if persist_embedding_cache else None)
         self.index_handler : IndexHandler = IndexHandler(self.embedder)
+        self.register_metrics()
+
+        # Rebuild the cache and indexes from whatever was persisted before the last shutdown.
+        self.warm_start()
+
+    def register_metrics(self):
+        # Cache and worker statistics are already counted by their owners; /metrics reads them on scrape.
+        REGISTRY.callback("vectordb_embedding_cache_total", "Embedding cache lookups by outcome.", "counter",
+                          lambda: {(outcome,): self.embedder.stats()[outcome] for outcome in ("memory_hits", "disk_hits", "misses")}, ("result",))
+        REGISTRY.callback("vectordb_embedding_cache_entries", "Embeddings held in the in-memory cache.", "gauge", lambda: {(): self.embedder.stats()["entries"]})
+        REGISTRY.callback("vectordb_embedding_batches_total", "Encoder passes run by the embedding worker.", "counter", lambda: {(): self.embedding_worker.stats()["batches"]})
+        REGISTRY.callback("vectordb_embedding_batch_size_mean", "Mean texts per encoder pass.", "gauge", lambda: {(): self.embedding_worker.stats()["mean_batch_size"]})
+        REGISTRY.callback("vectordb_indexed_chunks", "Chunks held in each library's embedding store.", "gauge",
+                          lambda: {(library_id,): len(store) for library_id, store in list(self.index_handler.stores.items())}, ("library_id",))
+        REGISTRY.callback("vectordb_library_store_bytes", "Bytes held by each library's columns, text arena and embedding matrix.", "gauge",
+                          lambda: {(library_id,): library.nbytes() for library_id, library in list(self.cache.items())}, ("library_id",))
+
+    def warm_start(self):
+        start = time.perf_counter()
+        self.migrateHandler.handle_migrate_embeddings() # Rewrites any pickled embedding rows before they are loaded.
+        self.cache = self.loadHandler.handle_load_libraries()
+
+        # Persisted planes and bucket keys let LSH libraries be rebuilt without re-hashing.
+        bucket_keys = self.lshStateHandler.handle_load_bucket_keys() if self.lshStateHandler.handle_load_planes(self.index_handler.lsh) else {}
+        for library in self.cache.values():
+            self.persist_lsh_keys(library.id, self.index_handler.index_library(library, bucket_keys))
+        print(f"Indexed {len(self.cache)} libraries; ready in {time.perf_counter() - start:.2f}s")
     
+    def persist_lsh_keys(self, library_id : str, keys : Dict[str, List[int]]):
+        if not keys:
+            return
+        self.lshStateHandler.handle_save_planes(self.index_handler.lsh)
+        self.lshStateHandler.handle_save_bucket_keys(library_id, keys)
+
     #region Library Methods
     def add_new_library(self, library : Library):
-        if library.id in self.cache:
-            HTTPException(status_code=404, detail="Attempted to add a library that already exists!")
-        
-        self.cache[library.id] = library
-        self.libraryHandler.handle_add_libraries([(library.id, str(library.metadata))])
-        self.documentHandler.handle_add_documents(library.id, library.documents.values())
-        self.chunkHandler.handle_add_chunks(self.embedder, get_docid_chunk_dict(library.documents.values()))
-        self.index_handler.index_library(library)
-        return library
+        with self.mutation_lock:
+            if library.id in self.cache:
+                raise HTTPException(status_code=409, detail="Attempted to add a library that already exists!")
+
+            # Every mutation commits to SQLite before touching the cache and indexes, so a failed commit leaves both unchanged.
+            with self.db.transaction():
+                self.libraryHandler.handle_add_libraries([(library.id, str(library.metadata), library.index_engine)])
+                self.documentHandler.handle_add_documents(library.id, library.documents.values())
+                self.chunkHandler.handle_add_chunks(self.embedder, get_docid_chunk_dict(library.documents.values()))
+                # The library's own index structures are built before taking the write lock, which only covers
+                # the shared inverted/LSH postings and the swap.
+                store = LibraryStore.from_model(library)
+                prepared = self.index_handler.prepare_library(store)
+                self.persist_lsh_keys(library.id, prepared.new_keys)
+
+            with self.lock.write(), timed("index_mutation"):
+                self.cache[library.id] = store
+                self.index_handler.index_library(store, prepared=prepared)
+            return library
     
-    def get_library(self, library_id : str):
-        if library_id not in self.cache:
-            raise HTTPException(status_code=404, detail="Library not found")
-        return self.cache[library_id]
+    def get_library(self, library_id : str, include_embeddings : bool = True) -> Library:
+        with self.lock.read():
+            library = self.cache.get(library_id)
+            if library is None:
+                raise HTTPException(status_code=404, detail="Library not found")
+            return library.to_model(include_embeddings)
     
-    def get_all_libraries(self):
-        return self.cache.values()
+    def get_all_libraries(self) -> List[Library]:
+        with self.lock.read():
+            return [library.to_model() for library in self.cache.values()]
+
+    def get_libraries_page(self, limit : int, cursor : Optional[str] = None, include_embeddings : bool = True) -> Tuple[List[Library], Optional[str]]:
+        with self.lock.read():
+            libraries, next_cursor = self._paginate(list(self.cache.items()), limit, cursor)
+            return [library.to_model(include_embeddings) for library in libraries], next_cursor
+
+    def _paginate(self, items, limit : int, cursor : Optional[str]):
+        try:
+            return paginate(items, limit, cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     
     def update_library(self, updated_library : Library):
-        if updated_library.id not in self.cache:
-                raise HTTPException(status_code=404, detail="Library not found")
-        
-        # Form the data we will be inserting into DB. Might be better to simplify this and have it be returned in a utils method.
-        updated_docs = []
-        new_docs = []
-        updated_chunks = []
-        new_chunks : Dict[str, List[TextChunk]] = {}
-        for doc_id, doc in updated_library.documents.items():
-            if doc_id in self.index_handler.lsh.docs:
-                updated_docs.append((str(doc.metadata), doc_id))
-            else:
-                new_docs.append(doc)
-            for cid, chunk in doc.chunks.items():
-                if not chunk.embeddings:
-                    new_chunks.setdefault(doc_id, []).append(chunk)
+        with self.mutation_lock:
+            if updated_library.id not in self.cache:
+                    raise HTTPException(status_code=404, detail="Library not found")
+
+            # Form the data we will be inserting into DB. Might be better to simplify this and have it be returned in a utils method.
+            updated_docs = []
+            new_docs = []
+            rewritten : List[Tuple[str, str, TextChunk]] = [] # (chunk_id, doc_id, chunk) of existing chunks whose embedding is rewritten.
+            kept_embeddings = [] # Unchanged chunks: their stored embedding is left as is, not rewritten from the (possibly float16) store.
+            reembedded : List[TextChunk] = [] # Existing chunks whose text changed.
+            new_chunks : Dict[str, List[TextChunk]] = {}
+            existing = self.cache[updated_library.id]
+            for doc_id, doc in updated_library.documents.items():
+                if doc_id in existing.documents:
+                    updated_docs.append((str(doc.metadata), doc_id))
                 else:
-                    updated_chunks.append((chunk.text, pickle.dumps(chunk.embeddings), str(chunk.metadata), cid))
-        
-        # Update cache.
-        self.cache[updated_library.id] = updated_library
-
-        # Update vector DB indexing.
-        self.index_handler.index_library(updated_library)
-
-        # Update DB.
-        self.db.execute_proc("pr_batch_update_libraries.sql", [(str(updated_library.metadata), updated_library.id)])
-        if updated_docs:
-            self.db.execute_proc("pr_batch_update_documents.sql", updated_docs)
-        if new_docs:
-            self.documentHandler.handle_add_documents(updated_library.id, new_docs)
-        if updated_chunks:
-            self.db.execute_proc("pr_batch_update_chunks.sql", updated_chunks)
-        if new_chunks:
-            self.chunkHandler.handle_add_chunks(self.embedder, new_chunks)
-        return updated_library
+                    new_docs.append(doc)
+                for cid, chunk in doc.chunks.items():
+                    if cid not in existing:
+                        new_chunks.setdefault(doc_id, []).append(chunk) # Inserted (and embedded) as in add_chunk.
+                    elif chunk.embeddings:
+                        rewritten.append((cid, doc_id, chunk))
+                    else:
+                        # Responses leave embeddings out, so clients send existing chunks back without them.
+                        previous = existing.chunk(cid)
+                        if previous.text == chunk.text:
+                            chunk.embeddings = previous.embeddings.tolist()
+                            kept_embeddings.append((chunk.text, str(chunk.metadata), doc_id, cid))
+                        else:
+                            reembedded.append(chunk)
+                            rewritten.append((cid, doc_id, chunk))
+
+            # Changed texts are embedded together, in the same bounded batches as ingest.
+            if reembedded:
+                for chunk, embedding in zip(reembedded, self.embedder.embed_batched([chunk.text for chunk in reembedded], self.chunkHandler.batch_size)):
+                    chunk.embeddings = embedding
+            updated_chunks = [(chunk.text, encode_embedding(chunk.embeddings, self.embedding_dtype), str(chunk.metadata), doc_id, cid) for cid, doc_id, chunk in rewritten]
+
+            # Chunks and documents left out of the update are deleted, rows and all, so they do not come back on restart.
+            kept_chunks = {cid for doc in updated_library.documents.values() for cid in doc.chunks}
+            dropped_chunks = [chunk_id for chunk_id in existing.row_of if chunk_id not in kept_chunks]
+            dropped_docs = [(doc_id,) for doc_id in existing.documents if doc_id not in updated_library.documents]
+
+            # Update DB.
+            with self.db.transaction():
+                self.db.execute_proc("pr_batch_update_libraries.sql", [(str(updated_library.metadata), updated_library.index_engine, updated_library.id)])
+                if updated_docs:
+                    self.db.execute_proc("pr_batch_update_documents.sql", updated_docs)
+                if new_docs:
+                    self.documentHandler.handle_add_documents(updated_library.id, new_docs)
+                if updated_chunks:
+                    self.db.execute_proc("pr_batch_update_chunks.sql", updated_chunks)
+                if kept_embeddings:
+                    self.db.execute_proc("pr_batch_update_chunk_fields.sql", kept_embeddings)
+                if new_chunks:
+                    self.chunkHandler.handle_add_chunks(self.embedder, new_chunks)
+                # Chunks moved to another document were re-parented above, so deleting dropped documents cannot cascade to them.
+                if dropped_chunks:
+                    self.db.execute_proc("pr_batch_delete_chunks.sql", [(chunk_id,) for chunk_id in dropped_chunks])
+                    self.lshStateHandler.handle_delete_bucket_keys(dropped_chunks)
+                if dropped_docs:
+                    self.db.execute_proc("pr_batch_delete_documents.sql", dropped_docs)
+
+                # Built once every new chunk has been embedded, outside the write lock as in add_new_library.
+                # Searches keep using the previous graph and store until the swap.
+                store = LibraryStore.from_model(updated_library)
+                prepared = self.index_handler.prepare_library(store)
+                if updated_library.index_engine != "lsh":
+                    self.lshStateHandler.handle_delete_library_bucket_keys(updated_library.id)
+                self.persist_lsh_keys(updated_library.id, prepared.new_keys)
+
+            # Update cache and vector DB indexing, once committed.
+            with self.lock.write(), timed("index_mutation"):
+                self.cache[updated_library.id] = store
+                self.index_handler.index_library(store, prepared=prepared)
+            return updated_library
     
     def delete_library(self, library_id : str):
-        if library_id not in self.cache:
-                raise HTTPException(status_code=404, detail="Library not found")
+        with self.mutation_lock:
+            if library_id not in self.cache:
+                    raise HTTPException(status_code=404, detail="Library not found")
 
-        doc_ids = []
-        chunk_ids = []
-        for doc_id, doc in self.cache[library_id].documents.items():
-            doc_ids.append((doc_id,))
-            for chunk_id in doc.chunks.keys():
-                chunk_ids.append((chunk_id,))
+            doc_ids = [(doc_id,) for doc_id in self.cache[library_id].documents]
+            chunk_ids = [(chunk_id,) for chunk_id in self.cache[library_id].row_of]
 
-        # Update vector DB index. We don't want chunks removed to be included in indexing.
-        self.index_handler.delete_library(self.cache[library_id])
+            # Update DB. Delete chunks, then documents, and lastly library to avoid dependency issues.
+            with self.db.transaction():
+                self.db.execute_proc("pr_batch_delete_chunks.sql", chunk_ids)
+                self.db.execute_proc("pr_batch_delete_documents.sql", doc_ids)
+                self.db.execute_proc("pr_batch_delete_libraries.sql", [(library_id, )])
+                self.lshStateHandler.handle_delete_library_bucket_keys(library_id)
 
-        # Update cache.
-        del self.cache[library_id]
+            with self.lock.write(), timed("index_mutation"):
+                # Update vector DB index. We don't want chunks removed to be included in indexing.
+                self.index_handler.delete_library(library_id)
 
-        # Update DB. Delete chunks, then documents, and lastly library to avoid dependency issues.
-        self.db.execute_proc("pr_batch_delete_chunks.sql", chunk_ids)
-        self.db.execute_proc("pr_batch_delete_documents.sql", doc_ids)
-        self.db.execute_proc("pr_batch_delete_libraries.sql", [(library_id, )])
+                # Update cache.
+                del self.cache[library_id]
 
-        return {"detail": "Library deleted"}
+            return {"detail": "Library deleted"}
     #endregion
 
 
     #region Chunk Methods
     def add_chunk(self, library_id : str, document_id : str, chunk : TextChunk):
-        chunk.embeddings = self.embedder.embed(chunk.text) # Embed the text for ease of use later on.
-
-        library = self.cache.get(library_id)
-        if not library:
-            raise HTTPException(status_code=404, detail="Library not found")
+        with self.mutation_lock:
+            library = self.cache.get(library_id)
+            if not library:
+                raise HTTPException(status_code=404, detail="Library not found")
 
-        if not library.documents:
-            raise HTTPException(status_code=400, detail="No documents in library to add chunk to")
-        
-        self.index_handler.add_chunk(library_id, document_id, chunk)
-        for _, document in library.documents.items():
-            if document_id == document.id:
-                document.chunks.setdefault(chunk.id, chunk)
-                self.chunkHandler.handle_add_chunks(self.embedder, {document_id : [chunk]})
-                return True
-        
-        return False
+            if not library.documents:
+                raise HTTPException(status_code=400, detail="No documents in library to add chunk to")
+
+            document = library.documents.get(document_id)
+            if document is None:
+                return False
+
+            with self.db.transaction():
+                self.chunkHandler.handle_add_chunks(self.embedder, {document_id : [chunk]}) # Embeds the text once, for both the DB and indexing.
+                self._check_dimension(library, chunk.embeddings)
+                keys = self.index_handler.lsh_keys(library_id, chunk.embeddings)
+                self.persist_lsh_keys(library_id, {chunk.id : keys} if keys else {})
+
+            with self.lock.write(), timed("index_mutation"):
+                if chunk.id not in library:
+                    library.set_chunk(document_id, chunk.id, chunk.text, chunk.embeddings, chunk.metadata)
+                self.index_handler.add_chunk(library_id, document_id, chunk, document.metadata, keys)
+            self._rebuild_ann(library_id)
+            return True
     
     def update_chunk(self, library_id : str, document_id : str, chunk_id : str, chunk : TextChunk):
-
-        chunk.embeddings = self.embedder.embed(chunk.text)
-        
-        # Update cache.
-        self.cache[library_id].documents[document_id].chunks[chunk_id] = chunk
-
-        # Update DB.
-        self.db.execute_proc("pr_batch_update_chunks.sql", [(chunk.text, pickle.dumps(chunk.embeddings), str(chunk.metadata), chunk_id)])
-
-        # Update indexing
-        self.index_handler.update_chunk(library_id, document_id, chunk)
+        with self.mutation_lock:
+            library = self.cache.get(library_id)
+            if not library:
+                raise HTTPException(status_code=404, detail="Library not found")
+            document = library.documents.get(document_id)
+            if document is None:
+                raise HTTPException(status_code=404, detail="Document not found")
+            if chunk_id not in library:
+                raise HTTPException(status_code=404, detail="Chunk not found")
+
+            chunk.id = chunk_id # The path names the chunk; a body without an id would otherwise get a fresh one.
+            chunk.embeddings = self.embedder.embed(chunk.text)
+            self._check_dimension(library, chunk.embeddings)
+
+            # Update DB.
+            with self.db.transaction():
+                self.db.execute_proc("pr_batch_update_chunks.sql", [(chunk.text, encode_embedding(chunk.embeddings, self.embedding_dtype), str(chunk.metadata), document_id, chunk_id)])
+                keys = self.index_handler.lsh_keys(library_id, chunk.embeddings)
+                self.persist_lsh_keys(library_id, {chunk.id : keys} if keys else {})
+
+            # Update cache and indexing, once committed.
+            with self.lock.write(), timed("index_mutation"):
+                library.set_chunk(document_id, chunk_id, chunk.text, chunk.embeddings, chunk.metadata)
+                self.index_handler.update_chunk(library_id, document_id, chunk, document.metadata, keys)
+            self._rebuild_ann(library_id)
 
     def delete_chunk(self, library_id : str, chunk_id : str):
-        library = self.cache.get(library_id)
-        if not library:
-            raise HTTPException(status_code=404, detail="Library not found")
-
-        found = False
+        with self.mutation_lock:
+            library = self.cache.get(library_id)
+            if not library:
+                raise HTTPException(status_code=404, detail="Library not found")
+            if chunk_id not in library:
+                raise HTTPException(status_code=404, detail="Chunk not found")
 
-        self.db.execute_proc("pr_batch_delete_chunks.sql", [(chunk_id,)])
-        for _, doc in library.documents.items():
-            if chunk_id in doc.chunks:
-                self.index_handler.delete_chunk(doc.chunks[chunk_id])
-                del doc.chunks[chunk_id]
-                found = True
-                break
+            with self.db.transaction():
+                self.db.execute_proc("pr_batch_delete_chunks.sql", [(chunk_id,)])
+                self.lshStateHandler.handle_delete_bucket_keys([chunk_id])
 
-        if not found:
-            raise HTTPException(status_code=404, detail="Chunk not found")
+            with self.lock.write(), timed("index_mutation"):
+                self.index_handler.delete_chunk(library_id, chunk_id)
+                library.remove(chunk_id)
+            self._rebuild_ann(library_id)
 
-        return {"detail": "Chunk deleted"}
+            return {"detail": "Chunk deleted"}
     
-    def get_chunks(self, library_id : str):
-        chunks = []
-
-        library = self.cache.get(library_id)
-        for _, doc in library.documents.items():
-            for _, chunk in doc.chunks.items():
-                chunks.append(chunk)
-        
-        return chunks
+    def get_chunks(self, library_id : str) -> List[TextChunk]:
+        with self.lock.read():
+            return [chunk.to_model() for chunk in self.cache[library_id].chunks()]
+
+    def get_chunks_page(self, library_id : str, limit : int, cursor : Optional[str] = None, include_embeddings : bool = True) -> Tuple[List[TextChunk], Optional[str]]:
+        with self.lock.read():
+            library = self.cache.get(library_id)
+            if library is None:
+                raise HTTPException(status_code=404, detail="Library not found")
+            chunks, next_cursor = self._paginate(library.chunk_items(), limit, cursor)
+            return [chunk.to_model(include_embeddings) for chunk in chunks], next_cursor
     #endregion
     
-    def search_chunk_from_text(self, request : QueryRequest):
-        ids = self.index_handler.do_lsh_search(request.query)
-
-        if not ids:
-            raise HTTPException(status_code=400, detail="No chunks available in library")
+    def _rebuild_ann(self, library_id : str):
+        # Graph compaction and IVF-PQ training run outside the write lock, which is only taken to swap the result in.
+        rebuilt = self.index_handler.rebuild_ann(library_id)
+        if rebuilt is not None:
+            with self.lock.write(), timed("index_mutation"):
+                self.index_handler.set_ann_index(library_id, rebuilt)
+
+    def _check_dimension(self, library : LibraryStore, embedding : List[float]):
+        # Checked before committing, so the store never rejects a chunk SQLite already holds.
+        if library.dim and len(embedding) != library.dim:
+            raise HTTPException(status_code=400, detail=f"Embedding dimension {len(embedding)} does not match library dimension {library.dim}")
+
+    def _chunk(self, key) -> ChunkView:
+        # Search hits are read straight from the library's columns; only the fields a result needs are decoded.
+        library_id, _, chunk_id = key
+        return self.cache[library_id].chunk(chunk_id)
+
+    def _check_scope(self, request : SearchOptions):
+        if request.library_id is not None and request.library_id not in self.cache:
+            raise HTTPException(status_code=404, detail="Library not found")
 
-        query_embedding = self.embedder.embed(request.query)
+    def _search_result(self, key, score : float, request : QueryRequest, label : str = "score", sources : Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        '''
+        Shapes one search hit: the requested fields when request.fields is set, otherwise the chunk (without its embeddings) and its score.
+        '''
+        library_id, doc_id, _ = key
+        chunk = self._chunk(key)
+        if request.fields is not None:
+            return project_chunk(library_id, doc_id, chunk, request.fields, score, sources)
 
-        similarities = [
-            (self.cache[library_id].documents[doc_id].chunks[chunk_id], cosine_similarity(query_embedding, self.cache[library_id].documents[doc_id].chunks[chunk_id].embeddings))
-            for library_id, doc_id, chunk_id in ids
-        ]
+        result = {"chunk": chunk.to_dict(), label: score}
+        if sources is not None:
+            result["scores"] = sources
+        return result
 
-        top_chunks = sorted(similarities, key=lambda x: x[1], reverse=True)[:request.top_k]
+    def search_chunk_from_text(self, request : QueryRequest):
+        if request.mode == "keyword":
+            return self.search_chunk_from_keywords(request)
+        if request.mode == "hybrid":
+            return self.search_chunk_hybrid(request)
+
+        SEARCHES.inc(1, "semantic")
+        # Embed before taking the read lock, so a slow encode never holds up writers.
+        with timed("embed_query"):
+            query_embedding = self.embedder.embed(request.query)
+        with self.lock.read():
+            self._check_scope(request)
+
+            # LSH candidates are scored in bulk against each library's normalized embedding matrix; graph engines score themselves.
+            top_chunks = self.index_handler.search(query_embedding, request)
+
+            if not top_chunks:
+                raise HTTPException(status_code=400, detail="No chunks available in library")
+
+            with timed("serialize"):
+                return [self._search_result(key, sim, request, "similarity") for key, sim in top_chunks]
+    
+    def search_chunk_from_keywords(self, request : QueryRequest):
+        SEARCHES.inc(1, "keyword")
+        with self.lock.read():
+            self._check_scope(request)
+            top_chunks = self.index_handler.do_inverted_search(request.query, request.top_k, request)
+
+            with timed("serialize"):
+                return [self._search_result(key, score, request) for key, score in top_chunks]
+
+    def search_chunk_hybrid(self, request : QueryRequest):
+        # Each retriever contributes a deeper list than top_k so fusion can promote chunks ranked moderately by both.
+        SEARCHES.inc(1, "hybrid")
+        depth_request = request.model_copy(update={"top_k": request.top_k * self.hybrid_depth})
+        with timed("embed_query"):
+            query_embedding = self.embedder.embed(request.query)
+        with self.lock.read():
+            self._check_scope(request)
+
+            # Both retrievers run under this thread's read lock, so they must not take it themselves.
+            semantic = self.search_pool.submit(self.index_handler.search, query_embedding, depth_request)
+            keyword = self.search_pool.submit(self.index_handler.do_inverted_search, request.query, depth_request.top_k, request)
+            rankings = {"semantic": semantic.result(), "keyword": keyword.result()}
+
+            if not any(rankings.values()):
+                raise HTTPException(status_code=400, detail="No chunks available in library")
+
+            with timed("fusion"):
+                if request.fusion == "weighted":
+                    fused = weighted_score_fusion(rankings, {"semantic": request.semantic_weight, "keyword": 1 - request.semantic_weight})
+                else:
+                    fused = reciprocal_rank_fusion(rankings, request.rrf_k)
 
-        return [{"chunk": chunk, "similarity": sim} for chunk, sim in top_chunks]
+            with timed("serialize"):
+                return [self._search_result(key, score, request, sources=sources) for key, score, sources in fused[:request.top_k]]
+    
+    def search_batch(self, request : BatchQueryRequest):
+        # Queries are encoded in bounded, length-bucketed batches, then scored at matrix level per library.
+        SEARCHES.inc(len(request.queries), "batch")
+        with timed("embed_query"):
+            query_embeddings = self.embedder.embed_batched(request.queries, self.embedding_worker.max_batch_size)
+        with self.lock.read():
+            self._check_scope(request)
+            per_query = self.index_handler.search_batch(query_embeddings, request)
+
+            with timed("serialize"):
+                results = []
+                for top_chunks in per_query:
+                    results.append([project_chunk(library_id, doc_id, self._chunk((library_id, doc_id, chunk_id)), request.fields, sim) for (library_id, doc_id, chunk_id), sim in top_chunks])
+                return results
     
     #region Test Code
     def test_insert(self):
@@ -216,8 +453,9 @@ class LibraryDataManager:
         self.add_new_library(library)
 
         print("Before deleting.")
-        for ids in self.index_handler.lsh.buckets.values():
-            print(f"Size: {len(ids)}")
+        for table in self.index_handler.lsh.buckets:
+            for bucket in table.values():
+                print(f"Size: {sum(len(ids) for ids in bucket.values())}")
         
         print(f"Chunks: {len(self.db.fetch('SELECT * FROM chunks;'))}")
         print(f"Library: {len(self.db.fetch('SELECT * FROM libraries;'))}")
@@ -225,17 +463,18 @@ class LibraryDataManager:
         
         newDoc = Document(metadata={})
         library.documents[newDoc.id] = newDoc
+        self.update_library(library)
 
         self.add_chunk(library.id, newDoc.id, TextChunk(metadata={}, text="Testing"))
         print(f"Received chunks: {len(self.get_chunks(library.id))}")
         print(f"Querying...: {self.search_chunk_from_text(QueryRequest(query = "11", top_k = 5))}")
         print(f"Received library: {self.get_library(library.id)}")
-        self.update_library(library)
         self.delete_library(library.id)
 
         print("after deleting.")
-        for ids in self.index_handler.lsh.buckets.values():
-            print(f"Size: {len(ids)}")
+        for table in self.index_handler.lsh.buckets:
+            for bucket in table.values():
+                print(f"Size: {sum(len(ids) for ids in bucket.values())}")
         print(f"Chunks: {len(self.db.fetch('SELECT * FROM chunks;'))}")
         print(f"Library: {len(self.db.fetch('SELECT * FROM libraries;'))}")
         print(f"Documents: {len(self.db.fetch('SELECT * FROM documents;'))}")
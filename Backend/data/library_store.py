@@ -0,0 +1,328 @@
+from typing import List, Dict, Tuple, Optional, Iterator, Sequence
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+import numpy as np
+
+from indexing.embedding_store import EmbeddingStore
+from utils.mathUtils import normalize
+
+from Common.schemas.library import Library
+from Common.schemas.document import Document
+from Common.schemas.text_chunk import TextChunk
+
+class ChunkView:
+    """
+    Read-only view of one row of a LibraryStore, exposing the fields of a TextChunk without materializing one.
+    embeddings is a view into the store's (normalized) embedding matrix. Views are only valid until the next mutation of the store,
+    so they are used under the manager's read lock and never kept.
+    """
+    __slots__ = ("store", "row")
+
+    def __init__(self, store : "LibraryStore", row : int):
+        self.store = store
+        self.row = row
+
+    @property
+    def id(self) -> str:
+        return self.store.chunk_ids[self.row]
+
+    @property
+    def text(self) -> str:
+        return self.store.text(self.row)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self.store.matrix[self.row]
+
+    @property
+    def metadata(self) -> Dict[str, str]:
+        return self.store.metadata_values[self.store.metadata_of[self.row]]
+
+    @property
+    def document_id(self) -> str:
+        return self.store.document_entries[self.store.document_of[self.row]].id
+
+    def to_dict(self) -> Dict[str, object]:
+        # The chunk as search results serialize it, without its embeddings.
+        return {"id": self.id, "text": self.text, "metadata": dict(self.metadata)}
+
+    def to_model(self, include_embeddings : bool = True) -> TextChunk:
+        embeddings = self.embeddings.tolist() if include_embeddings else []
+        return TextChunk.model_construct(id=self.id, text=self.text, embeddings=embeddings, metadata=dict(self.metadata))
+
+class DocumentEntry:
+    __slots__ = ("id", "index", "metadata", "rows")
+
+    def __init__(self, doc_id : str, index : int, metadata : Dict[str, str]):
+        self.id = doc_id
+        self.index = index
+        self.metadata = metadata
+        self.rows = array("i") # The document's rows, in chunk order.
+
+class RowIds:
+    """
+    row -> (doc_id, chunk_id) lookups over a LibraryStore's columns, standing in for EmbeddingStore.ids without a tuple per row.
+    """
+    __slots__ = ("store",)
+
+    def __init__(self, store : "LibraryStore"):
+        self.store = store
+
+    def __len__(self):
+        return self.store.size
+
+    def __getitem__(self, row : int) -> Optional[Tuple[str, str]]:
+        chunk_id = self.store.chunk_ids[row]
+        if chunk_id is None:
+            return None
+        return (self.store.document_entries[self.store.document_of[row]].id, chunk_id)
+
+class ChunkItems(Sequence):
+    """
+    (chunk_id, ChunkView) pairs of a LibraryStore in document/chunk order, for paginate.
+    Positions are resolved through each document's rows array, so a slice only builds views for the rows it returns.
+    """
+    __slots__ = ("store", "entries", "starts")
+
+    def __init__(self, store : "LibraryStore"):
+        self.store = store
+        self.entries = list(store.documents.values())
+        self.starts = [0, *accumulate(len(entry.rows) for entry in self.entries)] # Document index -> position of its first chunk.
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def _rows(self, start : int, stop : int) -> List[int]:
+        rows = []
+        doc = bisect_right(self.starts, start) - 1
+        while start < stop and doc < len(self.entries):
+            offset = start - self.starts[doc]
+            taken = self.entries[doc].rows[offset:offset + stop - start]
+            rows.extend(taken)
+            start += len(taken)
+            doc += 1
+        return rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("ChunkItems only supports contiguous slices")
+            return [(self.store.chunk_ids[row], ChunkView(self.store, row)) for row in self._rows(start, stop)]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        row = self._rows(index, index + 1)[0]
+        return (self.store.chunk_ids[row], ChunkView(self.store, row))
+
+    def __iter__(self):
+        for chunk in self.store.chunks():
+            yield (chunk.id, chunk)
+
+class LibraryStore(EmbeddingStore):
+    """
+    Columnar in-memory copy of one library, replacing its Library -> Document -> TextChunk model tree.
+    Each chunk is a row of parallel columns: its id, its document, its text (a slice of one UTF-8 arena),
+    its metadata (an index into a table of distinct metadata dicts) and its embedding (a row of the EmbeddingStore matrix).
+    Embeddings are normalized once on insert, and the index handler scores this matrix directly, so each is held once.
+    IVF-PQ libraries search their PQ codes and only read the matrix to re-rank candidates, so they keep it as float16.
+    A library of any size is a handful of objects for the garbage collector to track, instead of several per chunk.
+    Rows freed by deletes are reused by later chunks. Pydantic models are only built at the API boundary, by to_model.
+    """
+    def __init__(self, library_id : str, metadata : Dict[str, str], index_engine : str = "lsh", initial_capacity : int = 1024):
+        super().__init__(0, initial_capacity, np.float16 if index_engine == "ivfpq" else np.float32)
+        self.id = library_id
+        self.metadata = metadata
+        self.index_engine = index_engine
+
+        self.documents : Dict[str, DocumentEntry] = {} # doc_id -> entry, in document order.
+        self.document_entries : List[DocumentEntry] = [] # Document index -> entry.
+
+        self.chunk_ids : List[Optional[str]] = [] # row -> chunk_id, None for free rows.
+        self.ids = RowIds(self)
+        self.document_of = np.zeros(0, dtype=np.int32)
+        self.metadata_of = np.zeros(0, dtype=np.int32)
+        self.text_start = np.zeros(0, dtype=np.int64)
+        self.text_length = np.zeros(0, dtype=np.int32)
+
+        # Texts are appended to the arena; replaced and deleted texts are left behind as garbage until compaction.
+        self.arena = bytearray()
+        self.garbage = 0
+
+        # Chunks mostly share a few metadata dicts (often just {}), so each distinct dict is stored once.
+        self.metadata_values : List[Dict[str, str]] = []
+        self.metadata_index : Dict[Tuple[Tuple[str, str], ...], int] = {}
+
+    @classmethod
+    def from_model(cls, library : Library) -> "LibraryStore":
+        '''
+        Copies a Library model tree into a new store. Every chunk must already carry its embeddings.
+        '''
+        size = sum(len(document.chunks) for document in library.documents.values())
+        store = cls(library.id, dict(library.metadata), library.index_engine, max(size, 1))
+        for doc_id, document in library.documents.items():
+            store.add_document(doc_id, document.metadata)
+            for chunk_id, chunk in document.chunks.items():
+                store.set_chunk(doc_id, chunk_id, chunk.text, chunk.embeddings, chunk.metadata)
+        return store
+
+    def to_model(self, include_embeddings : bool = True) -> Library:
+        '''
+        Materializes the library as a Library model tree, e.g. to serialize it. The models share nothing with the store.
+        Chunks are left with empty embeddings unless include_embeddings is set.
+        '''
+        documents = {}
+        for doc_id, entry in self.documents.items():
+            chunks = {self.chunk_ids[row]: ChunkView(self, row).to_model(include_embeddings) for row in entry.rows}
+            documents[doc_id] = Document.model_construct(id=doc_id, metadata=dict(entry.metadata), chunks=chunks)
+        return Library.model_construct(id=self.id, metadata=dict(self.metadata), index_engine=self.index_engine, documents=documents)
+
+    #region Columns
+    def _grow(self, min_rows : int):
+        capacity = max(self.initial_capacity, self.document_of.shape[0] * 2, min_rows)
+        for name in ("matrix", "document_of", "metadata_of", "text_start", "text_length"):
+            column = getattr(self, name)
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def _next_row(self) -> int:
+        if self.free_rows:
+            return self.free_rows.pop()
+        row = self.size
+        if row >= self.document_of.shape[0]:
+            self._grow(row + 1)
+        self.chunk_ids.append(None)
+        self.size += 1
+        return row
+
+    def _intern_metadata(self, metadata : Dict[str, str]) -> int:
+        key = tuple(sorted(metadata.items()))
+        index = self.metadata_index.get(key)
+        if index is None:
+            index = self.metadata_index[key] = len(self.metadata_values)
+            self.metadata_values.append(dict(metadata)) # A copy, so callers' dicts can change without touching the store.
+        return index
+
+    def text(self, row : int) -> str:
+        start = self.text_start[row]
+        return self.arena[start:start + self.text_length[row]].decode("utf-8")
+
+    def _set_text(self, row : int, text : str):
+        encoded = text.encode("utf-8")
+        self.text_start[row] = len(self.arena)
+        self.text_length[row] = len(encoded)
+        self.arena += encoded
+
+    def compact(self):
+        '''
+        Rewrites the text arena and metadata table with only the live rows' entries.
+        '''
+        arena = bytearray()
+        values, index, remap = [], {}, {}
+        for row in self.row_of.values():
+            start, length = self.text_start[row], self.text_length[row]
+            self.text_start[row] = len(arena)
+            arena += self.arena[start:start + length]
+
+            old = int(self.metadata_of[row])
+            if old not in remap:
+                remap[old] = len(values)
+                index[tuple(sorted(self.metadata_values[old].items()))] = len(values)
+                values.append(self.metadata_values[old])
+            self.metadata_of[row] = remap[old]
+        self.arena, self.garbage = arena, 0
+        self.metadata_values, self.metadata_index = values, index
+
+    def _release_text(self, length : int):
+        # Compacts once more than half of a non-trivial arena is garbage.
+        self.garbage += length
+        if self.garbage > 1 << 20 and self.garbage * 2 > len(self.arena):
+            self.compact()
+    #endregion
+
+    #region Mutations
+    def add_document(self, doc_id : str, metadata : Dict[str, str]):
+        entry = self.documents.get(doc_id)
+        if entry is None:
+            entry = self.documents[doc_id] = DocumentEntry(doc_id, len(self.document_entries), dict(metadata))
+            self.document_entries.append(entry)
+        else:
+            entry.metadata = dict(metadata)
+
+    def set_chunk(self, doc_id : str, chunk_id : str, text : str, embedding, metadata : Dict[str, str]) -> int:
+        '''
+        Stores a chunk under chunk_id in an existing document, overwriting it in place when already stored.
+        A chunk moved from another document joins the end of its new document. Returns the chunk's row.
+        '''
+        embedding = normalize(embedding)
+        if not self.dim:
+            self.dim = embedding.shape[0]
+            self.matrix = np.zeros((self.document_of.shape[0], self.dim), dtype=self.dtype)
+        if embedding.shape != (self.dim,):
+            raise ValueError(f"Embedding dimension {embedding.shape[0]} does not match library dimension {self.dim}")
+
+        entry = self.documents[doc_id]
+        replaced = 0 # Arena bytes of the text being overwritten.
+        row = self.row_of.get(chunk_id)
+        if row is None:
+            row = self._next_row()
+            self.row_of[chunk_id] = row
+            self.chunk_ids[row] = chunk_id
+            entry.rows.append(row)
+        else:
+            previous = self.document_entries[self.document_of[row]]
+            if previous is not entry:
+                previous.rows.remove(row)
+                entry.rows.append(row)
+            replaced = int(self.text_length[row])
+
+        self.document_of[row] = entry.index
+        self.metadata_of[row] = self._intern_metadata(metadata)
+        self.matrix[row] = embedding
+        self._set_text(row, text)
+        self._release_text(replaced)
+        return row
+
+    def add(self, doc_id : str, chunk_id : str, embedding : List[float]):
+        # EmbeddingStore interface: replaces the embedding, keeping the chunk's text and metadata when it is already stored.
+        chunk = self.chunk(chunk_id)
+        self.set_chunk(doc_id, chunk_id, chunk.text if chunk else "", embedding, chunk.metadata if chunk else {})
+
+    def remove(self, chunk_id : str) -> bool:
+        row = self.row_of.pop(chunk_id, None)
+        if row is None:
+            return False
+        self.document_entries[self.document_of[row]].rows.remove(row)
+        self.chunk_ids[row] = None
+        self.matrix[row] = 0
+        self.free_rows.append(row)
+        self._release_text(int(self.text_length[row]))
+        return True
+    #endregion
+
+    #region Reads
+    def chunk(self, chunk_id : str) -> Optional[ChunkView]:
+        row = self.row_of.get(chunk_id)
+        return None if row is None else ChunkView(self, row)
+
+    def chunks(self, doc_id : Optional[str] = None) -> Iterator[ChunkView]:
+        '''
+        Views of the document's chunks (every chunk, document by document, if doc_id is not given), in chunk order.
+        '''
+        entries = self.documents.values() if doc_id is None else [self.documents[doc_id]]
+        for entry in entries:
+            for row in entry.rows:
+                yield ChunkView(self, row)
+
+    def chunk_items(self) -> ChunkItems:
+        # Costs one entry per document, not per chunk; views are built only for the positions read.
+        return ChunkItems(self)
+
+    def nbytes(self) -> int:
+        # Bytes held by the columns, arena and embedding matrix (ids and dicts excluded).
+        columns = (self.matrix, self.document_of, self.metadata_of, self.text_start, self.text_length)
+        return sum(column.nbytes for column in columns) + len(self.arena)
+    #endregion
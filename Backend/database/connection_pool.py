@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from typing import Callable
+import queue
+import sqlite3
+import threading
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections to one database file. Each connection is used by one thread at a time,
+    so concurrent readers never share a cursor. Connections are opened lazily, up to size.
+    """
+    def __init__(self, db_file : str, size : int = 4, factory : Callable[[str], sqlite3.Connection] = None):
+        self.db_file = db_file
+        self.size = size
+        self.factory = factory or (lambda path: sqlite3.connect(path, check_same_thread=False))
+        self.idle : "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue() # Most recently used first, so warm connections are reused.
+        self.opened = 0
+        self.lock = threading.Lock() # Guards `opened`.
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            can_open = self.opened < self.size
+            if can_open:
+                self.opened += 1
+        if can_open:
+            return self.factory(self.db_file)
+        return self.idle.get() # Every connection is in use; wait for one to be returned.
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -1,18 +1,45 @@
 import sqlite3
 import os
+import threading
 from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict
+
+from database.connection_pool import ConnectionPool
+from utils.metrics import timed
 
 class DB():
     # Get the directory where this script lives
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-    def __init__(self, vector_db_file = "vector_db.sqlite"):
-        self.conn = sqlite3.connect(vector_db_file, check_same_thread=False)
+    def __init__(self, vector_db_file = "vector_db.sqlite", read_pool_size : int = 4, synchronous : str = "NORMAL", cache_size_kb : int = 65536):
+        self.conn = sqlite3.connect(vector_db_file, check_same_thread=False) # Write connection, used by the writer thread (and startup).
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer") # Every proc write runs on this one thread, so writes never interleave.
+        self.procs : Dict[str, str] = {} # Proc file name -> SQL text, read from disk once. sqlite3 caches the prepared statement per connection.
+        self.pending = threading.local() # Proc calls deferred by the current thread's open transaction().
+
+        # WAL lets readers proceed while the writer commits. With synchronous=NORMAL, commits no longer fsync;
+        # only checkpoints do, and the database stays consistent after a crash.
+        self.cache_size_kb = cache_size_kb
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute(f"PRAGMA synchronous={synchronous};")
+        self.conn.execute(f"PRAGMA cache_size=-{cache_size_kb};")
+        self.conn.execute("PRAGMA temp_store=MEMORY;")
+
+        # Reads check out their own read-only connection, so concurrent readers never share one or block behind the writer.
+        self.readers = ConnectionPool(vector_db_file, read_pool_size, self._open_reader)
 
         # For now, we will create the tables upon server start up.
         self.execute_sql_file(DB.construct_sql_path("sql/startup", "create_libraries_table.sql"))
         self.execute_sql_file(DB.construct_sql_path("sql/startup", "create_documents_table.sql"))
         self.execute_sql_file(DB.construct_sql_path("sql/startup", "create_chunks_table.sql"))
+        self.execute_sql_file(DB.construct_sql_path("sql/startup", "create_embedding_cache_table.sql"))
+        self.execute_sql_file(DB.construct_sql_path("sql/startup", "create_lsh_planes_table.sql"))
+        self.execute_sql_file(DB.construct_sql_path("sql/startup", "create_lsh_buckets_table.sql"))
+
+        # Columns added after the initial schema; older database files are migrated in place.
+        self.add_column_if_missing("libraries", "index_engine", "TEXT NOT NULL DEFAULT 'lsh'")
     
     def execute_sql_file(self, file_path: str):
         if not self.is_connection_open():
@@ -23,15 +50,100 @@ class DB():
         self.conn.executescript(sql_script)
         self.conn.commit()
     
+    def _open_reader(self, vector_db_file : str) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"{Path(vector_db_file).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA cache_size=-{self.cache_size_kb};")
+        return conn
+
+    def proc_sql(self, file_name : str) -> str:
+        sql = self.procs.get(file_name)
+        if sql is None:
+            sql = Path(DB.construct_sql_path("sql/procs", file_name)).read_text()
+            self.procs[file_name] = sql
+        return sql
+
     def execute_proc(self, file_name : str, objects):
-        proc_path = DB.construct_sql_path("sql/procs", file_name)
+        pending = getattr(self.pending, "procs", None)
+        if pending is not None:
+            pending.append((file_name, objects)) # Committed together when the enclosing transaction() exits.
+            return
+        # Blocks until the writer has committed, so callers can read their own writes.
+        return self.writer.submit(self._execute_procs, [(file_name, objects)]).result()
 
-        sql = Path(proc_path).read_text()
-        self.conn.executemany(sql, objects)
-        self.conn.commit()
+    def submit_proc(self, file_name : str, objects) -> Future:
+        '''
+        Queues a write on the writer thread without waiting for its commit, and outside any open transaction().
+        For writes nothing depends on, such as cache fills; failures are logged rather than raised.
+        '''
+        future = self.writer.submit(self._execute_procs, [(file_name, objects)])
+        future.add_done_callback(lambda done: done.exception() and print(f"Background write {file_name} failed: {done.exception()!r}"))
+        return future
+
+    def _execute_procs(self, procs):
+        # One transaction (and one commit) for the whole list; any failure rolls every statement back.
+        with timed("db_commit"), self.conn:
+            for file_name, objects in procs:
+                self.conn.executemany(self.proc_sql(file_name), objects)
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Defers every execute_proc call this thread makes inside the block, then runs them on the writer as a single
+        transaction. Nothing is written if the block raises. Writes inside the block are not visible to reads until it exits,
+        and the commit itself can still raise there, so callers apply their in-memory changes after the block.
+        Nested blocks join the outermost one.
+        '''
+        if getattr(self.pending, "procs", None) is not None:
+            yield
+            return
+
+        self.pending.procs, self.pending.callbacks = [], []
+        try:
+            yield
+            procs, callbacks = self.pending.procs, self.pending.callbacks
+        finally:
+            self.pending.procs = self.pending.callbacks = None
+        if procs:
+            self.writer.submit(self._execute_procs, procs).result()
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback):
+        '''
+        Runs callback once the current thread's open transaction() has committed, and never if it rolls back.
+        Outside a transaction, execute_proc has already committed, so it runs right away.
+        '''
+        callbacks = getattr(self.pending, "callbacks", None)
+        if callbacks is None:
+            callback()
+        else:
+            callbacks.append(callback)
+    
+    def add_column_if_missing(self, table : str, column : str, definition : str):
+        columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table});").fetchall()]
+        if column not in columns:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+            self.conn.commit()
+    
+    def fetch_proc(self, file_name : str, params = ()):
+        with self.readers.connection() as conn:
+            return conn.execute(self.proc_sql(file_name), params).fetchall()
+    
+    def fetch_proc_pages(self, file_name : str, page_size : int = 5000, params = ()):
+        '''
+        Yields the rows of a SELECT proc in pages of page_size, so large tables are never fully materialized.
+        '''
+        with self.readers.connection() as conn: # Held until the last page is read.
+            cursor = conn.execute(self.proc_sql(file_name), params)
+            while True:
+                rows = cursor.fetchmany(page_size)
+                if not rows:
+                    break
+                yield rows
     
     def fetch(self, sql_line : str):
-        return self.conn.execute(sql_line).fetchall()
+        with self.readers.connection() as conn:
+            return conn.execute(sql_line).fetchall()
     
     def is_connection_open(self):
         '''
@@ -44,6 +156,8 @@ class DB():
             return False
         
     def close_connection(self):
+        self.writer.shutdown(wait=True) # Let queued writes commit first.
+        self.readers.close()
         self.conn.close()
     
     def construct_sql_path(folder : str, file_name : str):
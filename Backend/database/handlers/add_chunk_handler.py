@@ -1,20 +1,25 @@
 from typing import Dict, List
-import pickle
 
 from database.database_obj import DB
-from utils.embedder import SentenceTransformerEmbedder
+from utils.embedder import BaseEmbedder
+from utils.embedding_codec import encode_embedding
 
 from Common.schemas.text_chunk import TextChunk
 
 class AddChunkHandler():
-    def __init__(self, db : DB):
+    def __init__(self, db : DB, batch_size : int = 64, embedding_dtype : str = "float32"):
         self.db = db
+        self.batch_size = batch_size # Number of chunk texts sent to the embedder per forward pass.
+        self.embedding_dtype = embedding_dtype # Precision of stored embedding BLOBs ("float32" or "float16").
     
-    def handle_add_chunks(self, embedder : SentenceTransformerEmbedder, chunks : Dict[str, List[TextChunk]]):
+    def handle_add_chunks(self, embedder : BaseEmbedder, chunks : Dict[str, List[TextChunk]]):
+        # Collect chunks across every document so the embedder sees full batches.
+        pending = [(doc_id, chunk) for doc_id, chunk_list in chunks.items() for chunk in chunk_list]
+        embeddings = embedder.embed_batched([chunk.text for _, chunk in pending], self.batch_size)
+
         insert_data = []
-        for doc_id, chunk_list in chunks.items():
-            for chunk in chunk_list:
-                chunk.embeddings = embedder.embed(chunk.text)
-                insert_data.append((chunk.id, doc_id, chunk.text, pickle.dumps(chunk.embeddings), str(chunk.metadata)))
+        for (doc_id, chunk), embedding in zip(pending, embeddings):
+            chunk.embeddings = embedding
+            insert_data.append((chunk.id, doc_id, chunk.text, encode_embedding(chunk.embeddings, self.embedding_dtype), str(chunk.metadata)))
 
         self.db.execute_proc("pr_batch_insert_chunks.sql", insert_data)
\ No newline at end of file
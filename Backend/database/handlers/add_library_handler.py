@@ -1,4 +1,4 @@
-from typing import List, Union
+from typing import List, Tuple
 from database.database_obj import DB
 from Common.schemas.library import Library
 
@@ -6,5 +6,5 @@ class AddLibraryHandler():
     def __init__(self, db : DB):
         self.db = db
     
-    def handle_add_libraries(self, libraries : List[Union[str, str]]):
+    def handle_add_libraries(self, libraries : List[Tuple[str, str, str]]):
         self.db.execute_proc("pr_batch_insert_libraries.sql", libraries)
\ No newline at end of file
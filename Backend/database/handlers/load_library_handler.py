@@ -0,0 +1,49 @@
+from typing import Dict
+import ast
+import time
+
+from database.database_obj import DB
+from data.library_store import LibraryStore
+from utils.embedding_codec import decode_embedding
+
+class LoadLibraryHandler():
+    def __init__(self, db : DB, page_size : int = 5000):
+        self.db = db
+        self.page_size = page_size # Rows fetched per round trip while streaming tables.
+
+    def _metadata(self, raw : str) -> Dict[str, str]:
+        # Metadata is persisted as str(dict).
+        return ast.literal_eval(raw) if raw else {}
+
+    def handle_load_libraries(self) -> Dict[str, LibraryStore]:
+        '''
+        Rebuilds every persisted library from the libraries, documents and chunks tables.
+        Embeddings are decoded from their stored BLOBs straight into each library's matrix, so nothing is re-embedded.
+        '''
+        start = time.perf_counter()
+        libraries : Dict[str, LibraryStore] = {}
+        documents : Dict[str, LibraryStore] = {} # doc_id -> library store.
+
+        for rows in self.db.fetch_proc_pages("pr_select_all_libraries.sql", self.page_size):
+            for library_id, metadata, index_engine in rows:
+                libraries[library_id] = LibraryStore(library_id, self._metadata(metadata), index_engine)
+
+        for rows in self.db.fetch_proc_pages("pr_select_all_documents.sql", self.page_size):
+            for doc_id, library_id, metadata in rows:
+                if library_id not in libraries:
+                    continue # Orphaned row; its library was deleted.
+                libraries[library_id].add_document(doc_id, self._metadata(metadata))
+                documents[doc_id] = libraries[library_id]
+
+        loaded = 0
+        for rows in self.db.fetch_proc_pages("pr_select_all_chunks.sql", self.page_size):
+            for chunk_id, doc_id, text, embedding, metadata in rows:
+                library = documents.get(doc_id)
+                if library is None:
+                    continue
+                library.set_chunk(doc_id, chunk_id, text, decode_embedding(embedding), self._metadata(metadata))
+            loaded += len(rows)
+            print(f"Loaded {loaded} chunks ({time.perf_counter() - start:.2f}s)")
+
+        print(f"Loaded {len(libraries)} libraries, {len(documents)} documents and {loaded} chunks from DB in {time.perf_counter() - start:.2f}s")
+        return libraries
@@ -0,0 +1,54 @@
+from typing import Dict, List
+import numpy as np
+
+from database.database_obj import DB
+from indexing.lsh_index import LSHIndex
+
+class LSHStateHandler():
+    def __init__(self, db : DB, page_size : int = 5000):
+        self.db = db
+        self.page_size = page_size
+        self.planes_saved = False # Planes are immutable once drawn, so they only need saving once.
+
+    def handle_load_planes(self, lsh : LSHIndex) -> bool:
+        '''
+        Restores the persisted hyperplanes into the index. Returns False when none are stored, or when they
+        were drawn for a different table layout, in which case stored bucket keys are stale and are dropped.
+        '''
+        rows = self.db.fetch_proc("pr_select_lsh_planes.sql")
+        if not rows:
+            return False
+        num_tables, num_planes, dim, planes = rows[0]
+        if num_tables != lsh.num_tables or num_planes != lsh.num_planes:
+            print(f"Persisted LSH layout ({num_tables}x{num_planes}) differs from the configured one ({lsh.num_tables}x{lsh.num_planes}); re-hashing.")
+            self.db.execute_proc("pr_delete_all_lsh_buckets.sql", [()])
+            return False
+
+        self.planes_saved = lsh.load_planes(np.frombuffer(planes, dtype="<f4").reshape(num_tables * num_planes, dim))
+        return self.planes_saved
+
+    def handle_save_planes(self, lsh : LSHIndex):
+        if self.planes_saved or lsh.planes is None:
+            return
+        self.db.execute_proc("pr_upsert_lsh_planes.sql", [(lsh.num_tables, lsh.num_planes, lsh.planes.shape[1], lsh.planes.astype("<f4").tobytes())])
+        self.db.after_commit(self._mark_planes_saved) # A rolled-back transaction leaves the flag unset, so the next save retries.
+
+    def _mark_planes_saved(self):
+        self.planes_saved = True
+
+    def handle_load_bucket_keys(self) -> Dict[str, List[int]]:
+        keys = {}
+        for rows in self.db.fetch_proc_pages("pr_select_all_lsh_buckets.sql", self.page_size):
+            for chunk_id, bucket_keys in rows:
+                keys[chunk_id] = np.frombuffer(bucket_keys, dtype="<i8").tolist()
+        return keys
+
+    def handle_save_bucket_keys(self, library_id : str, keys : Dict[str, List[int]]):
+        if keys:
+            self.db.execute_proc("pr_batch_upsert_lsh_buckets.sql", [(chunk_id, library_id, np.asarray(chunk_keys, dtype="<i8").tobytes()) for chunk_id, chunk_keys in keys.items()])
+
+    def handle_delete_bucket_keys(self, chunk_ids : List[str]):
+        self.db.execute_proc("pr_batch_delete_lsh_buckets.sql", [(chunk_id,) for chunk_id in chunk_ids])
+
+    def handle_delete_library_bucket_keys(self, library_id : str):
+        self.db.execute_proc("pr_batch_delete_library_lsh_buckets.sql", [(library_id,)])
@@ -0,0 +1,31 @@
+from database.database_obj import DB
+from utils.embedding_codec import encode_embedding, decode_legacy_embedding
+
+class MigrateEmbeddingsHandler():
+    def __init__(self, db : DB, page_size : int = 5000, dtype : str = "float32"):
+        self.db = db
+        self.page_size = page_size
+        self.dtype = dtype # Precision legacy rows are rewritten with.
+
+    def _migrate(self, select_proc : str, update_proc : str) -> int:
+        # Keyset pagination on rowid, so rows can be rewritten while we walk the table.
+        migrated = 0
+        last_rowid = 0
+        while True:
+            rows = self.db.fetch_proc(select_proc, (last_rowid, self.page_size))
+            if not rows:
+                return migrated
+            self.db.execute_proc(update_proc, [(encode_embedding(decode_legacy_embedding(blob), self.dtype), row_id) for _, row_id, blob in rows])
+            last_rowid = rows[-1][0]
+            migrated += len(rows)
+
+    def handle_migrate_embeddings(self) -> int:
+        '''
+        Rewrites every pickled embedding BLOB (chunks and embedding cache) in the binary embedding format.
+        Returns the number of rows migrated; a no-op once the database has been migrated.
+        '''
+        migrated = self._migrate("pr_select_legacy_chunk_embeddings.sql", "pr_batch_update_chunk_embeddings.sql")
+        migrated += self._migrate("pr_select_legacy_cache_embeddings.sql", "pr_batch_update_cache_embeddings.sql")
+        if migrated:
+            print(f"Migrated {migrated} pickled embeddings to the binary embedding format")
+        return migrated
\ No newline at end of file
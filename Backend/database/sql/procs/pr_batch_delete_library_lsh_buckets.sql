@@ -0,0 +1,3 @@
+-- Delete every LSH bucket key of a library
+DELETE FROM lsh_buckets
+WHERE library_id = ?;
\ No newline at end of file
@@ -0,0 +1,3 @@
+-- Delete the LSH bucket keys of a single chunk by ID
+DELETE FROM lsh_buckets
+WHERE chunk_id = ?;
\ No newline at end of file
@@ -1,2 +1,2 @@
 -- Batch inserts libraries into libraries database table.
-INSERT INTO libraries (id, metadata) VALUES (?, ?);
\ No newline at end of file
+INSERT INTO libraries (id, metadata, index_engine) VALUES (?, ?, ?);
\ No newline at end of file
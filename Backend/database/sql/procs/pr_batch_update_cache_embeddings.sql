@@ -0,0 +1,4 @@
+-- Rewrites the embedding BLOB of a cache entry.
+UPDATE embedding_cache
+SET embedding = ?
+WHERE key = ?;
\ No newline at end of file
@@ -0,0 +1,4 @@
+-- Rewrites the embedding BLOB of a chunk.
+UPDATE chunks
+SET embedding = ?
+WHERE id = ?;
\ No newline at end of file
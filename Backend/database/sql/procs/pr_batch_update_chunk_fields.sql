@@ -0,0 +1,4 @@
+-- Updates a chunk's text, metadata and document without rewriting its stored embedding.
+UPDATE chunks
+SET  text = ?, metadata = ?, document_id = ?
+WHERE id = ?;
\ No newline at end of file
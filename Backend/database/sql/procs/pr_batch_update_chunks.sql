@@ -1,3 +1,3 @@
 UPDATE chunks
-SET  text = ?, embedding = ?, metadata = ?
+SET  text = ?, embedding = ?, metadata = ?, document_id = ?
 WHERE id = ?;
\ No newline at end of file
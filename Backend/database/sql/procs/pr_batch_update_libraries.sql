@@ -1,3 +1,3 @@
 UPDATE libraries
-SET metadata = ?
+SET metadata = ?, index_engine = ?
 WHERE id = ?;
\ No newline at end of file
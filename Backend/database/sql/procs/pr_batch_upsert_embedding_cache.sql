@@ -0,0 +1,2 @@
+-- Batch inserts or replaces cached embeddings, keyed by a hash of model name and text.
+INSERT OR REPLACE INTO embedding_cache (key, embedding) VALUES (?, ?);
\ No newline at end of file
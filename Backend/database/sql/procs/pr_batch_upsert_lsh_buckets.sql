@@ -0,0 +1,2 @@
+-- Batch inserts or replaces the per-table LSH bucket keys of chunks.
+INSERT OR REPLACE INTO lsh_buckets (chunk_id, library_id, bucket_keys) VALUES (?, ?, ?);
\ No newline at end of file
@@ -0,0 +1,2 @@
+-- Drops every LSH bucket key, used when the hyperplanes change.
+DELETE FROM lsh_buckets;
\ No newline at end of file
@@ -0,0 +1,2 @@
+-- Streams every chunk for the startup loader.
+SELECT id, document_id, text, embedding, metadata FROM chunks;
\ No newline at end of file
@@ -0,0 +1,2 @@
+-- Streams every document for the startup loader.
+SELECT id, library_id, metadata FROM documents;
\ No newline at end of file
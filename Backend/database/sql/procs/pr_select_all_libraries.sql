@@ -0,0 +1,2 @@
+-- Streams every library for the startup loader.
+SELECT id, metadata, index_engine FROM libraries;
\ No newline at end of file
@@ -0,0 +1,2 @@
+-- Streams every persisted LSH bucket assignment for the startup loader.
+SELECT chunk_id, bucket_keys FROM lsh_buckets;
\ No newline at end of file
@@ -0,0 +1,3 @@
+-- Looks up the cached embeddings of a batch of keys, given as one JSON array.
+SELECT key, embedding FROM embedding_cache
+WHERE key IN (SELECT value FROM json_each(?));
\ No newline at end of file
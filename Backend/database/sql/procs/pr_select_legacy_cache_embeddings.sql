@@ -0,0 +1,5 @@
+-- Pages through cached embeddings that are still legacy pickle BLOBs.
+SELECT rowid, key, embedding FROM embedding_cache
+WHERE rowid > ? AND substr(embedding, 1, 2) != X'5645'
+ORDER BY rowid
+LIMIT ?;
\ No newline at end of file
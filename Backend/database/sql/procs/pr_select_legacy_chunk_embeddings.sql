@@ -0,0 +1,5 @@
+-- Pages through chunks whose embedding is still a legacy pickle BLOB (anything without the b'VE' header).
+SELECT rowid, id, embedding FROM chunks
+WHERE rowid > ? AND substr(embedding, 1, 2) != X'5645'
+ORDER BY rowid
+LIMIT ?;
\ No newline at end of file
@@ -0,0 +1,3 @@
+-- Loads the persisted LSH hyperplanes.
+SELECT num_tables, num_planes, dim, planes FROM lsh_planes
+WHERE id = 0;
\ No newline at end of file
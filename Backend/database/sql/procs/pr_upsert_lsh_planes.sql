@@ -0,0 +1,2 @@
+-- Saves the LSH hyperplanes. There is only ever one row.
+INSERT OR REPLACE INTO lsh_planes (id, num_tables, num_planes, dim, planes) VALUES (0, ?, ?, ?, ?);
\ No newline at end of file
@@ -0,0 +1,4 @@
+CREATE TABLE IF NOT EXISTS embedding_cache (
+        key TEXT PRIMARY KEY,
+        embedding BLOB NOT NULL
+    )
\ No newline at end of file
@@ -1,4 +1,5 @@
 CREATE TABLE IF NOT EXISTS libraries (
         id TEXT PRIMARY KEY,
-        metadata TEXT
+        metadata TEXT,
+        index_engine TEXT NOT NULL DEFAULT 'lsh'
     )
\ No newline at end of file
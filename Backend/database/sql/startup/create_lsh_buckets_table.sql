@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+        chunk_id TEXT PRIMARY KEY,
+        library_id TEXT NOT NULL,
+        bucket_keys BLOB NOT NULL,
+        FOREIGN KEY(chunk_id) REFERENCES chunks(id) ON DELETE CASCADE
+    )
\ No newline at end of file
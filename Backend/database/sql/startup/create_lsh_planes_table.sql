@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS lsh_planes (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        num_tables INTEGER NOT NULL,
+        num_planes INTEGER NOT NULL,
+        dim INTEGER NOT NULL,
+        planes BLOB NOT NULL
+    )
\ No newline at end of file
@@ -0,0 +1,89 @@
+from typing import List, Dict, Tuple, Optional, Iterable
+import numpy as np
+
+from utils.mathUtils import normalize, top_k_indices
+
+class EmbeddingStore:
+    """
+    Contiguous embedding matrix for a single library (float32, or float16 to halve it).
+    Rows are L2-normalized on insert so cosine similarity reduces to a dot product,
+    and rows freed by deletes are reused by later inserts. Scores are computed in float32 either way.
+    """
+    def __init__(self, dim : int = 0, initial_capacity : int = 1024, dtype = np.float32):
+        self.dim = dim
+        self.initial_capacity = initial_capacity
+        self.dtype = np.dtype(dtype)
+        self.matrix = np.zeros((0, dim), dtype=self.dtype) # Allocated lazily once the dimension is known.
+        self.size = 0 # Number of rows handed out so far (live + free).
+        self.row_of : Dict[str, int] = {} # chunk_id -> row.
+        self.ids : List[Optional[Tuple[str, str]]] = [] # row -> (doc_id, chunk_id), None for free rows.
+        self.free_rows : List[int] = []
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def __contains__(self, chunk_id : str):
+        return chunk_id in self.row_of
+
+    def _grow(self, min_rows : int):
+        capacity = max(self.initial_capacity, self.matrix.shape[0] * 2, min_rows)
+        grown = np.zeros((capacity, self.dim), dtype=self.dtype)
+        grown[:self.size] = self.matrix[:self.size]
+        self.matrix = grown
+
+    def _next_row(self) -> int:
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.size >= self.matrix.shape[0]:
+            self._grow(self.size + 1)
+        self.ids.append(None)
+        self.size += 1
+        return self.size - 1
+
+    def add(self, doc_id : str, chunk_id : str, embedding : List[float]):
+        if not self.dim:
+            self.dim = len(embedding)
+            self.matrix = np.zeros((0, self.dim), dtype=self.dtype)
+        if len(embedding) != self.dim:
+            raise ValueError(f"Embedding dimension {len(embedding)} does not match library dimension {self.dim}")
+
+        row = self.row_of.get(chunk_id) # Overwrite in place when the chunk is already stored.
+        if row is None:
+            row = self._next_row()
+            self.row_of[chunk_id] = row
+        self.ids[row] = (doc_id, chunk_id)
+        self.matrix[row] = normalize(embedding)
+
+    def remove(self, chunk_id : str) -> bool:
+        row = self.row_of.pop(chunk_id, None)
+        if row is None:
+            return False
+        self.matrix[row] = 0
+        self.ids[row] = None
+        self.free_rows.append(row)
+        return True
+
+    def rows_for(self, chunk_ids : Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.row_of[cid] for cid in chunk_ids if cid in self.row_of), dtype=np.int64)
+
+    def live_rows(self) -> np.ndarray:
+        return np.fromiter(self.row_of.values(), dtype=np.int64, count=len(self.row_of))
+
+    def score(self, query : np.ndarray, rows : Optional[np.ndarray] = None) -> np.ndarray:
+        '''
+        Cosine similarity between a normalized query and the given rows (all live rows if not given).
+        '''
+        if rows is None:
+            rows = self.live_rows()
+        if not self.dim or rows.size == 0:
+            return np.empty(0, dtype=np.float32)
+        return self.matrix[rows] @ query.astype(np.float32, copy=False) # float16 rows are widened by the product.
+
+    def top_k(self, query : np.ndarray, k : int, rows : Optional[np.ndarray] = None) -> List[Tuple[str, str, float]]:
+        '''
+        Returns up to k (doc_id, chunk_id, similarity) tuples, highest similarity first.
+        '''
+        if rows is None:
+            rows = self.live_rows()
+        scores = self.score(query, rows)
+        return [(*self.ids[rows[i]], float(scores[i])) for i in top_k_indices(scores, k)]
@@ -0,0 +1,64 @@
+from typing import List, Tuple, Optional
+import heapq
+import numpy as np
+
+from indexing.embedding_store import EmbeddingStore
+from utils.mathUtils import top_k_rows
+
+class FlatIndex:
+    """
+    Exact brute-force search over a single library's EmbeddingStore.
+    Rows are scored in blocks of block_size, so each (queries x block) score matrix stays cache-sized.
+    Every block's top k are merged into a running per-query min-heap of size k.
+    Holds nothing but a reference to the store, so there is nothing to build or keep up to date.
+    """
+    def __init__(self, store : EmbeddingStore, block_size : int = 1024):
+        self.store = store
+        self.block_size = block_size
+
+    def __len__(self):
+        return len(self.store)
+
+    def _blocks(self, rows : Optional[np.ndarray]):
+        # Yields (rows, embeddings) blocks. Without free rows, the unrestricted case reads the matrix as contiguous slices.
+        store = self.store
+        if rows is None and not store.free_rows:
+            for start in range(0, store.size, self.block_size):
+                end = min(start + self.block_size, store.size)
+                yield np.arange(start, end), store.matrix[start:end]
+            return
+
+        rows = np.sort(store.live_rows() if rows is None else rows) # Ascending rows gather the matrix sequentially.
+        for start in range(0, rows.size, self.block_size):
+            block = rows[start:start + self.block_size]
+            yield block, store.matrix[block]
+
+    def search(self, query : np.ndarray, k : int, rows : Optional[np.ndarray] = None) -> List[Tuple[str, str, float]]:
+        '''
+        Returns up to k (doc_id, chunk_id, similarity) tuples for a normalized query, highest similarity first.
+        When rows is given, only those store rows are scored.
+        '''
+        return self.search_batch(np.atleast_2d(query), k, rows)[0]
+
+    def search_batch(self, queries : np.ndarray, k : int, rows : Optional[np.ndarray] = None) -> List[List[Tuple[str, str, float]]]:
+        '''
+        search for every row of a normalized (queries x dim) matrix. Each block of rows is scored against all queries in one product.
+        '''
+        heaps : List[List[Tuple[float, int]]] = [[] for _ in range(queries.shape[0])] # Per query: min-heap of (similarity, row).
+        if k <= 0 or not self.store.dim or not len(self.store):
+            return [[] for _ in heaps]
+
+        for block, embeddings in self._blocks(rows):
+            scores = queries @ embeddings.T
+            for heap, row_scores, columns in zip(heaps, scores, top_k_rows(scores, k)):
+                for column in columns:
+                    entry = (float(row_scores[column]), int(block[column]))
+                    if len(heap) < k:
+                        heapq.heappush(heap, entry)
+                    elif entry > heap[0]:
+                        heapq.heapreplace(heap, entry)
+                    else:
+                        break # Columns come best first, so the rest of this block cannot enter the heap.
+
+        ids = self.store.ids
+        return [[(*ids[row], sim) for sim, row in sorted(heap, reverse=True)] for heap in heaps]
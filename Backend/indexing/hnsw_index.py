@@ -0,0 +1,223 @@
+from typing import List, Dict, Tuple, Set, Optional
+import copy
+import heapq
+import math
+import numpy as np
+
+from utils.mathUtils import normalize
+
+class HNSWIndex:
+    """
+    Hierarchical Navigable Small World graph over a single library's embeddings.
+    Vectors are stored normalized, so similarity is a dot product (higher is closer).
+    Deletes are soft: removed nodes stay in the graph for navigation but are never returned.
+    Once soft-deleted nodes exceed compact_ratio of the live ones (needs_compaction), compacted() rebuilds the graph from the live nodes.
+    """
+    def __init__(self, M : int = 16, ef_construction : int = 200, ef_search : int = 64, seed : Optional[int] = None, compact_ratio : float = 0.5):
+        self.M = M # Max neighbours per node on upper layers.
+        self.M0 = 2 * M # Max neighbours per node on layer 0.
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / math.log(max(M, 2))
+        self.compact_ratio = compact_ratio
+        self.rng = np.random.default_rng(seed)
+
+        self.dim = 0
+        self.vectors = np.zeros((0, 0), dtype=np.float32) # node -> normalized embedding.
+        self.count = 0 # Number of nodes ever inserted (including soft-deleted ones).
+        self.graph : List[List[List[int]]] = [] # node -> level -> neighbour nodes.
+        self.labels : List[Tuple[str, str]] = [] # node -> (doc_id, chunk_id).
+        self.node_of : Dict[str, int] = {} # chunk_id -> live node.
+        self.deleted : Set[int] = set()
+        self.entry_point = -1
+        self.max_level = -1
+
+    def __len__(self):
+        return len(self.node_of)
+
+    def __contains__(self, chunk_id : str):
+        return chunk_id in self.node_of
+
+    def copy(self) -> "HNSWIndex":
+        '''
+        Independent copy, so an updated graph can be built while searches keep reading this one.
+        '''
+        clone = copy.copy(self)
+        clone.rng = copy.deepcopy(self.rng)
+        clone.vectors = self.vectors.copy()
+        clone.graph = [[list(links) for links in levels] for levels in self.graph]
+        clone.labels = list(self.labels)
+        clone.node_of = dict(self.node_of)
+        clone.deleted = set(self.deleted)
+        return clone
+
+    def _grow(self):
+        capacity = max(1024, self.vectors.shape[0] * 2)
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:self.count] = self.vectors[:self.count]
+        self.vectors = grown
+
+    def _random_level(self) -> int:
+        return int(-math.log(1.0 - self.rng.random()) * self.level_mult)
+
+    def _search_layer(self, query : np.ndarray, entry_points : List[int], ef : int, level : int) -> List[Tuple[float, int]]:
+        '''
+        Best-first search on one layer. Returns up to ef (similarity, node) pairs, highest similarity first.
+        '''
+        visited = set(entry_points)
+        sims = self.vectors[entry_points] @ query
+        candidates = [(-float(s), n) for s, n in zip(sims, entry_points)] # Max-heap on similarity.
+        heapq.heapify(candidates)
+        results = [(float(s), n) for s, n in zip(sims, entry_points)] # Min-heap holding the current best ef.
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+
+            neighbours = [n for n in self.graph[node][level] if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+
+            # Score every unvisited neighbour in one matrix-vector product.
+            for sim, n in zip((self.vectors[neighbours] @ query).tolist(), neighbours):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, n))
+                    heapq.heappush(results, (sim, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted(results, reverse=True)
+
+    def _select_neighbours(self, candidates : List[Tuple[float, int]], m : int) -> List[int]:
+        '''
+        HNSW neighbour-selection heuristic: keep a candidate only if it is closer to the new node than
+        to any neighbour already kept, which preserves links across clusters.
+        '''
+        selected : List[int] = []
+        for sim, node in candidates:
+            if len(selected) >= m:
+                break
+            if not selected or sim > float(np.max(self.vectors[selected] @ self.vectors[node])):
+                selected.append(node)
+
+        # Fill any remaining slots with the closest skipped candidates.
+        if len(selected) < m:
+            for _, node in candidates:
+                if len(selected) >= m:
+                    break
+                if node not in selected:
+                    selected.append(node)
+        return selected
+
+    def _prune(self, node : int, level : int):
+        max_links = self.M0 if level == 0 else self.M
+        links = self.graph[node][level]
+        if len(links) <= max_links:
+            return
+        sims = self.vectors[links] @ self.vectors[node]
+        order = np.argsort(-sims)[:max_links]
+        self.graph[node][level] = [links[i] for i in order]
+
+    def add(self, doc_id : str, chunk_id : str, embedding : List[float]):
+        if not self.dim:
+            self.dim = len(embedding)
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        if len(embedding) != self.dim:
+            raise ValueError(f"Embedding dimension {len(embedding)} does not match index dimension {self.dim}")
+
+        query = normalize(embedding)
+        if chunk_id in self.node_of:
+            node = self.node_of[chunk_id]
+            if np.allclose(self.vectors[node], query):
+                self.labels[node] = (doc_id, chunk_id) # Unchanged embedding: keep the node, only its document may have changed.
+                return
+            self.remove(chunk_id) # Re-inserting a changed chunk replaces its old node.
+
+        self._insert(doc_id, chunk_id, query)
+
+    def _insert(self, doc_id : str, chunk_id : str, query : np.ndarray):
+        if self.count >= self.vectors.shape[0]:
+            self._grow()
+        node = self.count
+        self.count += 1
+        self.vectors[node] = query
+        self.labels.append((doc_id, chunk_id))
+        self.node_of[chunk_id] = node
+
+        level = self._random_level()
+        self.graph.append([[] for _ in range(level + 1)])
+
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+
+        # Greedy descent through the layers above the new node's level.
+        entry = [self.entry_point]
+        for lvl in range(self.max_level, level, -1):
+            entry = [self._search_layer(query, entry, 1, lvl)[0][1]]
+
+        for lvl in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(query, entry, self.ef_construction, lvl)
+            neighbours = self._select_neighbours(candidates, self.M0 if lvl == 0 else self.M)
+            self.graph[node][lvl] = neighbours
+            for n in neighbours:
+                self.graph[n][lvl].append(node)
+                self._prune(n, lvl)
+            entry = [n for _, n in candidates]
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def remove(self, chunk_id : str) -> bool:
+        node = self.node_of.pop(chunk_id, None)
+        if node is None:
+            return False
+        self.deleted.add(node)
+        return True
+
+    @property
+    def needs_compaction(self) -> bool:
+        return len(self.deleted) > self.compact_ratio * max(len(self.node_of), 1)
+
+    def compacted(self) -> "HNSWIndex":
+        '''
+        A new graph holding only the live nodes. This one is left untouched, so searches can keep reading it while the new one is built.
+        '''
+        rebuilt = HNSWIndex(self.M, self.ef_construction, self.ef_search, compact_ratio=self.compact_ratio)
+        rebuilt.rng = copy.deepcopy(self.rng)
+        for node in sorted(self.node_of.values()):
+            rebuilt.add(*self.labels[node], self.vectors[node])
+        return rebuilt
+
+    def search(self, query_embedding : List[float], k : int, ef : Optional[int] = None) -> List[Tuple[str, str, float]]:
+        '''
+        Returns up to k (doc_id, chunk_id, similarity) tuples, highest similarity first.
+        '''
+        if self.entry_point < 0 or not self.node_of:
+            return []
+
+        query = normalize(query_embedding)
+        entry = [self.entry_point]
+        for lvl in range(self.max_level, 0, -1):
+            entry = [self._search_layer(query, entry, 1, lvl)[0][1]]
+
+        # Widen the beam by the number of soft-deleted nodes that may crowd out live results,
+        # and keep doubling it while they still do, until the whole graph is within reach.
+        wanted = min(k, len(self.node_of))
+        ef = max(ef or self.ef_search, k) + min(len(self.deleted), k)
+        while True:
+            results = []
+            for sim, node in self._search_layer(query, entry, ef, 0):
+                if node in self.deleted:
+                    continue
+                results.append((*self.labels[node], sim))
+                if len(results) >= k:
+                    break
+            if len(results) >= wanted or ef >= self.count:
+                return results
+            ef *= 2
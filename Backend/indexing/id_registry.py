@@ -0,0 +1,101 @@
+from typing import List, Dict, Tuple, Optional, Iterable
+import numpy as np
+
+class IdRegistry:
+    """
+    Interns chunk ids as dense int32 ids, shared by the inverted and LSH indexes.
+    Postings and buckets then hold 4-byte ints instead of (library_id, doc_id, chunk_id) string tuples.
+    Library and document membership live in parallel int32 arrays indexed by id, so candidates can be grouped
+    or masked by library without touching strings. Ids freed by releases are reused by later chunks.
+    """
+    def __init__(self, initial_capacity : int = 1024):
+        self.ids : Dict[str, int] = {} # chunk_id -> id.
+        self.chunk_ids : List[Optional[str]] = [] # id -> chunk_id, None for free ids.
+        self.library_of = np.full(initial_capacity, -1, dtype=np.int32) # id -> library index.
+        self.document_of = np.full(initial_capacity, -1, dtype=np.int32) # id -> document index.
+        self.free_ids : List[int] = []
+
+        # Library and document ids are interned too; they are few compared to chunks and are never released.
+        self.library_index : Dict[str, int] = {}
+        self.library_names : List[str] = []
+        self.document_index : Dict[str, int] = {}
+        self.document_names : List[str] = []
+
+    def __len__(self):
+        # Size of the id space (live + free), i.e. the length masks over ids need.
+        return len(self.chunk_ids)
+
+    def __contains__(self, chunk_id : str):
+        return chunk_id in self.ids
+
+    @staticmethod
+    def _intern(index : Dict[str, int], names : List[str], name : str) -> int:
+        value = index.get(name)
+        if value is None:
+            value = index[name] = len(names)
+            names.append(name)
+        return value
+
+    def _grow(self, min_size : int):
+        capacity = max(self.library_of.shape[0] * 2, min_size)
+        for name in ("library_of", "document_of"):
+            grown = np.full(capacity, -1, dtype=np.int32)
+            grown[:len(self.chunk_ids)] = getattr(self, name)[:len(self.chunk_ids)]
+            setattr(self, name, grown)
+
+    def intern(self, library_id : str, doc_id : str, chunk_id : str) -> int:
+        '''
+        Returns the chunk's id, assigning one on first sight. Its library and document are (re)recorded either way.
+        '''
+        value = self.ids.get(chunk_id)
+        if value is None:
+            if self.free_ids:
+                value = self.free_ids.pop()
+                self.chunk_ids[value] = chunk_id
+            else:
+                value = len(self.chunk_ids)
+                if value >= self.library_of.shape[0]:
+                    self._grow(value + 1)
+                self.chunk_ids.append(chunk_id)
+            self.ids[chunk_id] = value
+        self.library_of[value] = self._intern(self.library_index, self.library_names, library_id)
+        self.document_of[value] = self._intern(self.document_index, self.document_names, doc_id)
+        return value
+
+    def get(self, chunk_id : str) -> Optional[int]:
+        return self.ids.get(chunk_id)
+
+    def release(self, chunk_id : str) -> bool:
+        # Only the owner of the registry releases ids, once no index refers to the chunk any more.
+        value = self.ids.pop(chunk_id, None)
+        if value is None:
+            return False
+        self.chunk_ids[value] = None
+        self.library_of[value] = -1
+        self.document_of[value] = -1
+        self.free_ids.append(value)
+        return True
+
+    def key(self, value : int) -> Tuple[str, str, str]:
+        return (self.library_names[self.library_of[value]], self.document_names[self.document_of[value]], self.chunk_ids[value])
+
+    def ids_for(self, chunk_ids : Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.ids[cid] for cid in chunk_ids if cid in self.ids), dtype=np.int32)
+
+    def library_mask(self, library_id : str) -> np.ndarray:
+        '''
+        Boolean mask over the id space selecting the library's chunks.
+        '''
+        index = self.library_index.get(library_id, -2) # -2 never matches, not even free ids.
+        return self.library_of[:len(self.chunk_ids)] == index
+
+    def group(self, ids : np.ndarray) -> Dict[str, List[str]]:
+        '''
+        Splits ids into {library_id: [chunk_id, ...]} with one vectorized pass over the library array.
+        '''
+        libraries = self.library_of[ids]
+        grouped = {}
+        for index in np.unique(libraries).tolist():
+            if index >= 0:
+                grouped[self.library_names[index]] = [self.chunk_ids[value] for value in ids[libraries == index].tolist()]
+        return grouped
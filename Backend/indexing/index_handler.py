@@ -1,50 +1,475 @@
-from typing import List
+from typing import List, Dict, Tuple, Set, Iterable, Optional, Union
+import numpy as np
 
 from indexing.inverted_index import InvertedIndex
 from indexing.lsh_index import LSHIndex
+from indexing.embedding_store import EmbeddingStore
+from indexing.hnsw_index import HNSWIndex
+from indexing.ivfpq_index import IVFPQIndex
+from indexing.flat_index import FlatIndex
+from indexing.id_registry import IdRegistry
+from indexing.metadata_index import MetadataIndex
+from data.library_store import LibraryStore
 from utils.embedder import BaseEmbedder
+from utils.mathUtils import normalize, normalize_rows, top_k_indices, top_k_rows
+from utils.metrics import timed, CANDIDATES
 
-from Common.schemas.library import Library
+from Common.api_requests.query_request import QueryRequest, SearchOptions
 from Common.schemas.text_chunk import TextChunk
 
+class PreparedLibrary:
+    """
+    A library's own index structures, built by IndexHandler.prepare_library without touching anything searches read.
+    """
+    def __init__(self, metadata : MetadataIndex, ann_index : Optional[Union[HNSWIndex, IVFPQIndex]], keys : Dict[str, List[int]], new_keys : Dict[str, List[int]]):
+        self.metadata = metadata # Document/metadata postings over the library store's rows.
+        self.ann_index = ann_index # HNSW graph or IVF-PQ lists already holding every chunk; None for the "lsh" and "flat" engines.
+        self.keys = keys # LSH libraries: chunk_id -> bucket keys of every chunk.
+        self.new_keys = new_keys # The subset of keys hashed here rather than taken from persisted bucket keys.
+
 class IndexHandler():
-    def __init__(self, embedder : BaseEmbedder):
-        self.inverted = InvertedIndex()
-        self.lsh = LSHIndex()
+    def __init__(self, embedder : BaseEmbedder, hnsw_params : Optional[Dict[str, int]] = None, ivfpq_params : Optional[Dict[str, int]] = None, rerank_factor : int = 10, exact_filter_limit : int = 2048, batch_block_size : int = 256, flat_block_size : int = 1024, flat_fallback : bool = True):
+        self.registry = IdRegistry() # Dense int ids shared by the inverted and LSH postings; released here once both have dropped a chunk.
+        self.inverted = InvertedIndex(registry=self.registry)
+        self.lsh = LSHIndex(registry=self.registry) # Shared by every library using the "lsh" engine.
+        self.stores : Dict[str, EmbeddingStore] = {} # Per-library embedding matrix used for scoring: the library's own LibraryStore, written only by its owner.
+        self.metadata : Dict[str, MetadataIndex] = {} # Per-library document/metadata postings over the store's rows, used to pre-filter.
+        self.engines : Dict[str, str] = {} # library_id -> semantic search engine.
+        self.library_chunks : Dict[str, Dict[str, str]] = {} # library_id -> {chunk_id: doc_id}, so drops never scan shared postings.
+        self.ann_indexes : Dict[str, Union[HNSWIndex, IVFPQIndex]] = {} # Per-library indexes for engines other than "lsh".
+        self.hnsw_params = hnsw_params or {} # M / ef_construction / ef_search passed to new HNSW indexes.
+        self.ivfpq_params = ivfpq_params or {} # nlist / num_subspaces / nprobe / min_train_size passed to new IVF-PQ indexes.
+        self.rerank_factor = rerank_factor # IVF-PQ: candidates fetched per requested result when re-ranking exactly. Also the over-fetch for filtered graph searches.
+        self.exact_filter_limit = exact_filter_limit # Filtered subsets up to this many chunks are scored exhaustively instead of through the ANN engine.
+        self.batch_block_size = batch_block_size # Batch search: queries scored per matrix product, bounding the (queries x candidates) score matrix.
+        self.flat_block_size = flat_block_size # Flat search: store rows scored per matrix product (1024 x 384 float32 is ~1.5 MB).
+        self.flat_fallback = flat_fallback # Score LSH libraries exactly when every probed bucket comes back empty.
         self.embedder = embedder
 
-    def index_library(self, library: Library):
+    def _index_metadata(self, library_id : str, doc_id : str, chunk : TextChunk, document_metadata : Optional[Dict[str, str]]):
+        # Chunks inherit their document's metadata; their own fields take precedence.
+        row = self.stores[library_id].row_of[chunk.id]
+        self.metadata.setdefault(library_id, MetadataIndex()).add(row, doc_id, {**(document_metadata or {}), **chunk.metadata})
+
+    def _engine(self, library_id : str) -> str:
+        return self.engines.get(library_id, "lsh")
+
+    def _new_ann_index(self, engine : str) -> Union[HNSWIndex, IVFPQIndex]:
+        return HNSWIndex(**self.hnsw_params) if engine == "hnsw" else IVFPQIndex(**self.ivfpq_params)
+
+    def _set_engine(self, library_id : str, engine : str, ann_index : Optional[Union[HNSWIndex, IVFPQIndex]] = None):
+        previous = self.engines.get(library_id)
+        if previous == "lsh" and engine != "lsh":
+            # Unhash the library's chunks from the shared LSH tables before switching engines.
+            for chunk_id in self.library_chunks.get(library_id, {}):
+                self.lsh.delete_chunk(chunk_id)
+
+        self.engines[library_id] = engine
+        if ann_index is None:
+            self.ann_indexes.pop(library_id, None)
+        else:
+            self.ann_indexes[library_id] = ann_index
+
+    def prepare_library(self, library : LibraryStore, bucket_keys : Optional[Dict[str, List[int]]] = None) -> PreparedLibrary:
+        '''
+        Builds everything index_library installs that belongs to this library alone: its metadata postings, its HNSW graph
+        or IVF-PQ lists, and its LSH bucket keys. Nothing searches read is modified, so this runs outside the write lock
+        while mutations are serialized. An updated library's graph or lists are built on a copy of the current ones.
+        '''
+        metadata = MetadataIndex()
         for doc_id, document in library.documents.items():
-            for _, chunk in document.chunks.items():
+            for chunk in library.chunks(doc_id):
+                # Chunks inherit their document's metadata; their own fields take precedence.
+                metadata.add(chunk.row, doc_id, {**document.metadata, **chunk.metadata})
+
+        ann_index = None
+        keys, new_keys = {}, {}
+        if library.index_engine in ("hnsw", "ivfpq"):
+            current = self.ann_indexes.get(library.id) if self.engines.get(library.id) == library.index_engine else None
+            ann_index = current.copy() if current is not None else self._new_ann_index(library.index_engine)
+            for chunk_id in self.library_chunks.get(library.id, {}):
+                if chunk_id not in library:
+                    ann_index.remove(chunk_id) # Dropped since the library was last indexed.
+
+            items = [(doc_id, chunk.id, chunk.embeddings) for doc_id in library.documents for chunk in library.chunks(doc_id)]
+            if isinstance(ann_index, IVFPQIndex):
+                ann_index.add_many(items) # Encoded (and trained) as one batch.
+            else:
+                for item in items:
+                    ann_index.add(*item)
+                if ann_index.needs_compaction:
+                    ann_index = ann_index.compacted()
+        elif library.index_engine == "lsh":
+            bucket_keys = bucket_keys or {}
+            unhashed = []
+            for chunk in library.chunks():
+                if chunk.id in bucket_keys:
+                    keys[chunk.id] = bucket_keys[chunk.id]
+                else:
+                    unhashed.append(chunk)
+            if unhashed:
+                # Every remaining chunk of the library is hashed in one call.
+                hashed = self.lsh.hash_many(library.matrix[[chunk.row for chunk in unhashed]])
+                for chunk, chunk_keys in zip(unhashed, hashed.tolist()):
+                    keys[chunk.id] = new_keys[chunk.id] = chunk_keys
+        return PreparedLibrary(metadata, ann_index, keys, new_keys)
+
+    def index_library(self, library: LibraryStore, bucket_keys : Optional[Dict[str, List[int]]] = None, prepared : Optional[PreparedLibrary] = None) -> Dict[str, List[int]]:
+        '''
+        Installs the library: the store itself becomes the library's embedding matrix, replacing any previous one, next to the
+        structures built by prepare_library (built here when not given). Only the shared inverted and LSH indexes are updated
+        chunk by chunk. For LSH libraries, chunks with previously persisted bucket_keys are placed without re-hashing;
+        the keys of every newly hashed chunk are returned so they can be persisted.
+        '''
+        if prepared is None:
+            prepared = self.prepare_library(library, bucket_keys)
+        self._set_engine(library.id, library.index_engine, prepared.ann_index)
+        self.stores[library.id] = library
+        self.metadata[library.id] = prepared.metadata
+        chunk_docs = self.library_chunks.setdefault(library.id, {})
+        previous = set(chunk_docs)
+        entries = []
+        for doc_id in library.documents:
+            for chunk in library.chunks(doc_id):
                 # Add to inverted index (text search)
                 self.inverted.add_chunk(library.id, doc_id, chunk)
+                chunk_docs[chunk.id] = doc_id
+                entries.append((doc_id, chunk.id))
+
+        # Chunks dropped from the library since it was last indexed.
+        for chunk_id in previous.difference(chunk_id for _, chunk_id in entries):
+            self.delete_chunk(library.id, chunk_id)
+
+        if library.index_engine == "lsh":
+            for doc_id, chunk_id in entries:
+                self.lsh.add_hashed(library.id, doc_id, chunk_id, prepared.keys[chunk_id])
+        return prepared.new_keys
+
+    def do_lsh_search(self, query : str, probe_radius : Optional[int] = None, num_tables : Optional[int] = None) -> List[Tuple[str, str, str]]:
+        return [self.registry.key(value) for value in self.lsh.query_bucket(self.embedder.embed(query), probe_radius, num_tables).tolist()]
+
+    def do_inverted_search(self, query : str, top_k : int = 10, request : Optional[QueryRequest] = None):
+        with timed("keyword"):
+            return self.inverted.search(query, top_k, self._id_mask(request) if request else None)
+
+    def _scope(self, request : QueryRequest) -> List[str]:
+        if request.library_id is not None:
+            return [request.library_id] if request.library_id in self.engines else []
+        return list(self.engines)
+
+    def _filtered_rows(self, library_id : str, request : QueryRequest) -> Optional[Set[int]]:
+        '''
+        Store rows of the library's chunks that pass the request's document and metadata filters, or None when it has none.
+        '''
+        if request.document_id is None and not request.filters:
+            return None
+        index = self.metadata.get(library_id)
+        return index.match(request.document_id, request.filters) if index else set()
+
+    def _id_mask(self, request : QueryRequest) -> Optional[np.ndarray]:
+        '''
+        Boolean mask over registry ids implementing the request's scope and filters, or None when unrestricted.
+        '''
+        if request.library_id is None and request.document_id is None and not request.filters:
+            return None
+        mask = np.zeros(len(self.registry), dtype=bool)
+        for library_id in self._scope(request):
+            rows = self._filtered_rows(library_id, request)
+            if rows is None:
+                mask |= self.registry.library_mask(library_id)
+            elif rows:
+                ids = self.stores[library_id].ids
+                mask[self.registry.ids_for(ids[row][1] for row in rows)] = True
+        return mask
+
+    def search(self, query_embedding : List[float], request : QueryRequest) -> List[Tuple[Tuple[str, str, str], float]]:
+        '''
+        Runs the query against the engine of every library in scope and returns the merged top_k ((library_id, doc_id, chunk_id), similarity) pairs.
+        LSH candidates are rescored exactly; graph indexes return their own similarities and need no rescoring pass.
+        IVF-PQ candidates carry approximate similarities and are re-ranked exactly when request.rerank is set.
+        Document and metadata filters are resolved to store rows first. Small filtered subsets are scored exhaustively,
+        larger ones restrict the engine's candidates before scoring.
+        Flat libraries, and every library when request.exact is set, are scored exhaustively.
+        '''
+        query = normalize(query_embedding)
+        results = []
+        lsh_libraries = []
+        allowed : Dict[str, np.ndarray] = {}
+        for library_id in self._scope(request):
+            if library_id not in self.stores:
+                continue
+            rows = self._filtered_rows(library_id, request)
+            if rows is not None:
+                if not rows:
+                    continue
+                allowed[library_id] = np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+            engine = self._search_engine(library_id, request, rows)
+            if engine == "flat":
+                with timed("retrieve"):
+                    results.extend(self._flat_search(library_id, query, request.top_k, allowed.get(library_id))[0])
+            elif engine == "lsh":
+                lsh_libraries.append(library_id)
+            else:
+                results.extend(self._ann_search(library_id, query_embedding, request, rows))
+
+        if lsh_libraries:
+            # An unscoped, unfiltered query reads every library's share of the probed buckets.
+            scope = None if request.library_id is None and not allowed else lsh_libraries
+            with timed("retrieve"):
+                ids = self.lsh.query_bucket(query_embedding, request.probe_radius, request.num_tables, scope)
+            CANDIDATES.observe(ids.size, "lsh")
+            with timed("rescore"):
+                found = self._score_by_library(query_embedding, self.registry.group(ids), request.top_k, allowed)
+            if not found and self.flat_fallback:
+                # Every probed bucket was empty; an exact scan beats returning nothing.
+                with timed("retrieve"):
+                    for library_id in lsh_libraries:
+                        found.extend(self._flat_search(library_id, query, request.top_k, allowed.get(library_id))[0])
+            results.extend(found)
+
+        return sorted(results, key=lambda x: x[1], reverse=True)[:request.top_k]
+
+    def _search_engine(self, library_id : str, request : SearchOptions, rows : Optional[Set[int]]) -> str:
+        if request.exact or (rows is not None and len(rows) <= self.exact_filter_limit):
+            return "flat"
+        return self._engine(library_id)
 
-                # Add to vector index (exact vector search)
-                self.lsh.add_chunk(library.id, doc_id, chunk)
-
-    def do_lsh_search(self, query : str):
-        return self.lsh.query_bucket(self.embedder.embed(query))
-    
-    def do_inverted_search(self, query : str):
-        return self.inverted.search(query)
-    
-    def delete_chunk(self, chunk : TextChunk):
-        self.lsh.delete_chunk(chunk.id, chunk.embeddings)
-        self.inverted.delete_chunk(chunk.text, chunk.id)
-    
-    def add_chunk(self, library_id : str, document_id : str, chunk : TextChunk):
-        self.lsh.add_chunk(library_id, document_id, chunk)
+    def _flat_search(self, library_id : str, queries : np.ndarray, top_k : int, rows : Optional[np.ndarray] = None) -> List[List[Tuple[Tuple[str, str, str], float]]]:
+        '''
+        Exact top_k ((library_id, doc_id, chunk_id), similarity) pairs for each normalized query, in blocks of batch_block_size queries.
+        '''
+        flat = FlatIndex(self.stores[library_id], self.flat_block_size)
+        queries = np.atleast_2d(queries)
+        found = []
+        for start in range(0, queries.shape[0], self.batch_block_size):
+            found.extend(flat.search_batch(queries[start:start + self.batch_block_size], top_k, rows))
+        return [[((library_id, doc_id, chunk_id), sim) for doc_id, chunk_id, sim in entries] for entries in found]
+
+    def _ann_search(self, library_id : str, query_embedding : List[float], request : QueryRequest, rows : Optional[Set[int]]) -> List[Tuple[Tuple[str, str, str], float]]:
+        index = self.ann_indexes[library_id]
+        k = request.top_k if rows is None else request.top_k * self.rerank_factor # Over-fetch when filters will drop candidates.
+        if isinstance(index, IVFPQIndex):
+            if request.rerank:
+                with timed("retrieve"):
+                    candidates = index.search(query_embedding, request.top_k * self.rerank_factor, request.nprobe)
+                CANDIDATES.observe(len(candidates), "ivfpq")
+                allowed = {} if rows is None else {library_id: np.fromiter(rows, dtype=np.int64, count=len(rows))}
+                with timed("rescore"):
+                    return self.score_candidates(query_embedding, [(library_id, doc_id, chunk_id) for doc_id, chunk_id, _ in candidates], request.top_k, allowed)
+            with timed("retrieve"):
+                found = index.search(query_embedding, k, request.nprobe)
+        else:
+            with timed("retrieve"):
+                found = index.search(query_embedding, k, request.ef_search)
+
+        if rows is not None:
+            row_of = self.stores[library_id].row_of
+            found = [entry for entry in found if row_of.get(entry[1]) in rows][:request.top_k]
+        return [((library_id, doc_id, chunk_id), sim) for doc_id, chunk_id, sim in found]
+
+    def search_batch(self, query_embeddings, request : SearchOptions) -> List[List[Tuple[Tuple[str, str, str], float]]]:
+        '''
+        Batched counterpart of search, returning one merged top_k list per query.
+        Within each library, the candidates of every query are scored together as one query-matrix x candidate-matrix
+        product, masked so each query only ranks its own candidates. LSH buckets for all queries are hashed in one product.
+        Flat libraries score blocks of queries against blocks of rows. HNSW graphs are still walked per query.
+        '''
+        queries = normalize_rows(query_embeddings)
+        results = [[] for _ in range(queries.shape[0])]
+        lsh_libraries = []
+        allowed : Dict[str, np.ndarray] = {}
+        for library_id in self._scope(request):
+            store = self.stores.get(library_id)
+            if not store:
+                continue
+            rows = self._filtered_rows(library_id, request)
+            if rows is not None:
+                if not rows:
+                    continue
+                allowed[library_id] = np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+            engine = self._search_engine(library_id, request, rows)
+            index = self.ann_indexes.get(library_id)
+            if engine == "flat":
+                with timed("retrieve"):
+                    for found, exact in zip(results, self._flat_search(library_id, queries, request.top_k, allowed.get(library_id))):
+                        found.extend(exact)
+            elif engine == "lsh":
+                lsh_libraries.append(library_id)
+            elif isinstance(index, IVFPQIndex) and request.rerank:
+                with timed("retrieve"):
+                    candidates = [store.rows_for(chunk_id for _, chunk_id, _ in index.search(query, request.top_k * self.rerank_factor, request.nprobe)) for query in queries]
+                CANDIDATES.observe_many((rows.size for rows in candidates), "ivfpq")
+                with timed("rescore"):
+                    self._score_rows(library_id, queries, self._restrict(candidates, allowed.get(library_id)), request.top_k, results)
+            else:
+                for i, query in enumerate(queries):
+                    results[i].extend(self._ann_search(library_id, query, request, rows))
+
+        if lsh_libraries:
+            scope = None if request.library_id is None and not allowed else lsh_libraries
+            with timed("retrieve"):
+                per_query = self.lsh.query_buckets(queries, request.probe_radius, request.num_tables, scope)
+            CANDIDATES.observe_many((ids.size for ids in per_query), "lsh")
+            by_library = {library_id: [[] for _ in per_query] for library_id in lsh_libraries}
+            for i, ids in enumerate(per_query):
+                for library_id, chunk_ids in self.registry.group(ids).items():
+                    if library_id in by_library:
+                        by_library[library_id][i] = chunk_ids
+            before = [len(found) for found in results]
+            with timed("rescore"):
+                for library_id, chunk_ids in by_library.items():
+                    candidates = [self.stores[library_id].rows_for(ids) for ids in chunk_ids]
+                    self._score_rows(library_id, queries, self._restrict(candidates, allowed.get(library_id)), request.top_k, results)
+
+            empty = [i for i, found in enumerate(results) if len(found) == before[i]]
+            if empty and self.flat_fallback:
+                # Queries whose probed buckets were all empty are scored exactly instead.
+                for library_id in lsh_libraries:
+                    for i, exact in zip(empty, self._flat_search(library_id, queries[empty], request.top_k, allowed.get(library_id))):
+                        results[i].extend(exact)
+
+        return [sorted(found, key=lambda x: x[1], reverse=True)[:request.top_k] for found in results]
+
+    @staticmethod
+    def _restrict(candidates : List[np.ndarray], allowed : Optional[np.ndarray]) -> List[np.ndarray]:
+        if allowed is None:
+            return candidates
+        return [rows[np.isin(rows, allowed)] for rows in candidates]
+
+    def _score_rows(self, library_id : str, queries : np.ndarray, candidates : Union[np.ndarray, List[np.ndarray]], top_k : int, results : List[list]):
+        '''
+        Appends each query's top_k ((library_id, doc_id, chunk_id), similarity) pairs among its candidate rows to results.
+        candidates is either one row array shared by every query, or one row array per query.
+        '''
+        store = self.stores[library_id]
+        shared = isinstance(candidates, np.ndarray)
+        for start in range(0, queries.shape[0], self.batch_block_size):
+            block = queries[start:start + self.batch_block_size]
+            if shared:
+                union = candidates
+            else:
+                block_rows = candidates[start:start + self.batch_block_size]
+                union, inverse = np.unique(np.concatenate(block_rows), return_inverse=True)
+            if union.size == 0:
+                continue
+
+            scores = block @ store.matrix[union].T
+            if not shared:
+                # Each query only ranks its own candidates; every other column of the shared product is masked out.
+                mask = np.zeros(scores.shape, dtype=bool)
+                mask[np.repeat(np.arange(block.shape[0]), [rows.size for rows in block_rows]), inverse] = True
+                scores[~mask] = -np.inf
+
+            for offset, columns in enumerate(top_k_rows(scores, top_k)):
+                found = results[start + offset]
+                for column in columns:
+                    if scores[offset, column] == -np.inf:
+                        break
+                    found.append(((library_id, *store.ids[union[column]]), float(scores[offset, column])))
+
+    def score_candidates(self, query_embedding : List[float], ids : Iterable[Tuple[str, str, str]], top_k : int, allowed : Optional[Dict[str, np.ndarray]] = None) -> List[Tuple[Tuple[str, str, str], float]]:
+        '''
+        Rescores (library_id, doc_id, chunk_id) candidates against the query with one matrix-vector product per library.
+        Candidates of libraries present in allowed are first intersected with that library's permitted rows.
+        '''
+        by_library : Dict[str, List[str]] = {}
+        for library_id, _, chunk_id in ids:
+            by_library.setdefault(library_id, []).append(chunk_id)
+        return self._score_by_library(query_embedding, by_library, top_k, allowed)
+
+    def _score_by_library(self, query_embedding : List[float], by_library : Dict[str, List[str]], top_k : int, allowed : Optional[Dict[str, np.ndarray]] = None) -> List[Tuple[Tuple[str, str, str], float]]:
+        query = normalize(query_embedding)
+        keys = []
+        scores = []
+        for library_id, chunk_ids in by_library.items():
+            store = self.stores.get(library_id)
+            if not store:
+                continue
+            rows = store.rows_for(chunk_ids)
+            if allowed and library_id in allowed:
+                rows = rows[np.isin(rows, allowed[library_id])]
+            scores.append(store.score(query, rows))
+            keys.extend((library_id, *store.ids[row]) for row in rows)
+
+        if not keys:
+            return []
+        scores = np.concatenate(scores)
+        return [(keys[i], float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+    def delete_chunk(self, library_id : str, chunk_id : str):
+        # Every index keeps a forward map from chunk id, so this is proportional to the chunk's own size.
+        if library_id in self.ann_indexes:
+            self.ann_indexes[library_id].remove(chunk_id)
+        elif self._engine(library_id) == "lsh":
+            self.lsh.delete_chunk(chunk_id)
+        self.inverted.delete_chunk(chunk_id)
+        self.registry.release(chunk_id)
+        if library_id in self.stores:
+            # The row itself is freed by the store's owner, after this.
+            row = self.stores[library_id].row_of.get(chunk_id)
+            if row is not None and library_id in self.metadata:
+                self.metadata[library_id].remove(row)
+        self.library_chunks.get(library_id, {}).pop(chunk_id, None)
+
+    def rebuild_ann(self, library_id : str) -> Optional[Union[HNSWIndex, IVFPQIndex]]:
+        '''
+        Builds a replacement for the library's ANN index when single-chunk mutations have left it needing one:
+        an HNSW graph with too many soft-deleted nodes, or IVF-PQ lists with enough pending vectors to train.
+        The live index is only read, so this runs outside the write lock; install the result with set_ann_index.
+        '''
+        index = self.ann_indexes.get(library_id)
+        if isinstance(index, HNSWIndex) and index.needs_compaction:
+            return index.compacted()
+        if isinstance(index, IVFPQIndex) and index.needs_training:
+            trained = index.copy()
+            trained.train()
+            return trained
+        return None
+
+    def set_ann_index(self, library_id : str, index : Union[HNSWIndex, IVFPQIndex]):
+        self.ann_indexes[library_id] = index
+
+    def lsh_keys(self, library_id : str, embedding : List[float]) -> Optional[List[int]]:
+        '''
+        The chunk's LSH bucket keys when the library uses the LSH engine, so they can be persisted before the chunk is indexed.
+        '''
+        if self._engine(library_id) != "lsh":
+            return None
+        return self.lsh._hash(embedding)
+
+    def add_chunk(self, library_id : str, document_id : str, chunk : TextChunk, document_metadata : Optional[Dict[str, str]] = None, keys : Optional[List[int]] = None) -> Optional[List[int]]:
+        '''
+        Indexes a single chunk, which must already be stored in the library's store. Returns its LSH bucket keys when the library uses the LSH engine.
+        keys (from lsh_keys) skips hashing the chunk again. document_metadata is inherited by the chunk for metadata filtering.
+        '''
+        self.engines.setdefault(library_id, "lsh")
+        index = self.ann_indexes.get(library_id)
+        if isinstance(index, IVFPQIndex):
+            index.add_many([(document_id, chunk.id, chunk.embeddings)], train=False) # Trained by rebuild_ann, outside the write lock.
+        elif index is not None:
+            index.add(document_id, chunk.id, chunk.embeddings)
+        elif self._engine(library_id) == "lsh":
+            keys = keys if keys is not None else self.lsh._hash(chunk.embeddings)
+            self.lsh.add_hashed(library_id, document_id, chunk.id, keys)
         self.inverted.add_chunk(library_id, document_id, chunk)
-    
-    def update_chunk(self, library_id : str, document_id : str, chunk : TextChunk):
-        self.lsh.delete_chunk(chunk.id, chunk.embeddings)
-        self.inverted.delete_chunk(chunk.text, chunk.id)
-
-        self.add_chunk(library_id, document_id, chunk)
-    
-    # TODO: If we are considering time vs memory, storing the lib and doc ids as a separate hash might be preferred over the for loop.
-    def delete_library(self, library : Library):
-        for _, doc in library.documents.items():
-            for _, chunk in doc.chunks.items():
-                self.lsh.delete_library(library.id, chunk.embeddings)
-                self.inverted.delete_chunk(chunk.text, chunk.id)
\ No newline at end of file
+        self._index_metadata(library_id, document_id, chunk, document_metadata)
+        self.library_chunks.setdefault(library_id, {})[chunk.id] = document_id
+        return keys
+
+    def update_chunk(self, library_id : str, document_id : str, chunk : TextChunk, document_metadata : Optional[Dict[str, str]] = None, keys : Optional[List[int]] = None) -> Optional[List[int]]:
+        # Each index replaces the chunk's previous entries (found through its forward map) on re-add.
+        return self.add_chunk(library_id, document_id, chunk, document_metadata, keys)
+
+    def delete_library(self, library_id : str):
+        uses_lsh = self._engine(library_id) == "lsh"
+        for chunk_id in self.library_chunks.pop(library_id, {}):
+            if uses_lsh:
+                self.lsh.delete_chunk(chunk_id)
+            self.inverted.delete_chunk(chunk_id)
+            self.registry.release(chunk_id)
+        self.stores.pop(library_id, None)
+        self.metadata.pop(library_id, None)
+        self.ann_indexes.pop(library_id, None)
+        self.engines.pop(library_id, None)
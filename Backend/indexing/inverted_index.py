@@ -1,52 +1,158 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+from collections import Counter
+from array import array
+from bisect import bisect_left
+import math
+import sys
 import traceback
+import numpy as np
 
+from indexing.id_registry import IdRegistry
+from utils.tokenizer import Tokenizer
+from utils.mathUtils import top_k_indices
 from Common.schemas.text_chunk import TextChunk
 
-class InvertedIndex:
+class Posting:
     """
-    Simple inverted index over chunk texts.
-    Maps term -> set of (document_id, chunk_id)
+    One term's postings: sorted int32 chunk ids and their term frequencies in a parallel uint16 array.
     """
+    __slots__ = ("ids", "tfs")
+
     def __init__(self):
-        self.index: Dict[str, set] = {} # Keeps track of all unique tokens (words) and the corresponding documents and chunks they reside in.
-        self.docs = set() # Just for our use case in verify if doc exists in API side.
+        self.ids = array("i")
+        self.tfs = array("H")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, value : int, tf : int):
+        position = bisect_left(self.ids, value) # Fresh ids are mostly the largest, so this is usually an append.
+        self.ids.insert(position, value)
+        self.tfs.insert(position, min(tf, 0xFFFF))
+
+    def remove(self, value : int):
+        position = bisect_left(self.ids, value)
+        if position < len(self.ids) and self.ids[position] == value:
+            del self.ids[position]
+            del self.tfs[position]
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Zero-copy views; only held for the duration of a search, while writers are locked out.
+        return np.frombuffer(self.ids, dtype=np.int32), np.frombuffer(self.tfs, dtype=np.uint16)
+
+class InvertedIndex:
+    """
+    Inverted index over chunk texts, ranked with BM25.
+    Maps term -> Posting of registry ids and term frequencies, and keeps every chunk's token count in an array indexed by id.
+    A forward map from id to its distinct terms lets deletes touch only that chunk's postings.
+    """
+    def __init__(self, tokenizer : Optional[Tokenizer] = None, k1 : float = 1.2, b : float = 0.75, registry : Optional[IdRegistry] = None):
+        self.tokenizer = tokenizer or Tokenizer()
+        self.k1 = k1 # Term-frequency saturation.
+        self.b = b # Document-length normalization.
+        self.registry = registry if registry is not None else IdRegistry()
+        self.owns_registry = registry is None # A shared registry is released by its owner once every index has dropped the chunk.
+        self.index: Dict[str, Posting] = {} # Keeps track of all unique tokens (words) and the chunks they reside in, with their frequency.
+        self.max_tf: Dict[str, int] = {} # Highest frequency ever seen per term; bounds the term's best possible score.
+        self.lengths = np.zeros(1024, dtype=np.int32) # id -> token count of the indexed chunk.
+        self.total_length = 0
+        self.forward: Dict[int, Tuple[str, ...]] = {} # id -> distinct terms.
 
     def add_chunk(self, library_id : str, doc_id: str, chunk: TextChunk):
-        tokens = chunk.text.lower().split() # Normalize text so casing does not play a major role. Split on per word, since most queries are based on a per-word basis, not sentence level.
-        for token in tokens:
-            if token not in self.index:
-                self.index[token] = set() # Store unique Ids.
-            self.index[token].add((library_id, doc_id, chunk.id)) # Add doc and chunk id to index. Will update if I think library is worth storing as well.
-
-    def search(self, term: str) -> List[Tuple[str, str, str]]:
-        return list(self.index.get(term.lower(), [])) # Gets all document and chunk ids associated with a token.
-    
-    def delete_chunk(self, term : str, chunk_id : str) -> bool:
-        try:
-            if term.lower() not in self.index: return False
-            # Remove doc id from our set.
-            for _, doc_id, cid in self.index[term.lower()]:
-                if cid == chunk_id:
-                    if doc_id in self.docs: self.docs.remove(doc_id)
-                    break
-            self.index[term.lower()] = [(lib, doc_id, cid) for lib, doc_id, cid in self.index[term.lower()] if cid != chunk_id]
-            return True
-        except Exception:
-            print (f"Error occurred when trying to delete chunk: {traceback.extract_stack()}")
-            return False
-    
-    def delete_library(self, term : str, library_id : str) -> bool:
+        self.delete_chunk(chunk.id, release=False) # Re-adding a chunk replaces its previous terms.
+
+        value = self.registry.intern(library_id, doc_id, chunk.id)
+        if value >= self.lengths.shape[0]:
+            grown = np.zeros(max(self.lengths.shape[0] * 2, value + 1), dtype=np.int32)
+            grown[:self.lengths.shape[0]] = self.lengths
+            self.lengths = grown
+
+        tokens = self.tokenizer(chunk.text) # Normalize text so casing and punctuation do not play a major role.
+        counts = Counter(map(sys.intern, tokens)) # One shared string per term, instead of a copy per chunk held by the forward map.
+        for token, tf in counts.items():
+            posting = self.index.get(token)
+            if posting is None:
+                posting = self.index[token] = Posting()
+            posting.add(value, tf)
+            self.max_tf[token] = max(self.max_tf.get(token, 0), tf)
+        self.lengths[value] = len(tokens)
+        self.total_length += len(tokens)
+        self.forward[value] = tuple(counts)
+
+    def _idf(self, term : str) -> float:
+        df = len(self.index[term])
+        return math.log(1 + (len(self.forward) - df + 0.5) / (df + 0.5))
+
+    def search(self, query : str, top_k : int = 10, keep : Optional[np.ndarray] = None) -> List[Tuple[Tuple[str, str, str], float]]:
+        '''
+        Returns the top_k ((library_id, doc_id, chunk_id), BM25 score) pairs for a multi-term query, best first.
+        When keep is given (a boolean mask over registry ids), only the chunks it selects are scored.
+
+        Terms are scored from the highest to the lowest score upper bound (MaxScore). Once the current
+        k-th best score exceeds what the remaining terms could add to an unseen chunk, later (usually
+        common, low-idf) terms only update chunks already in the running instead of scanning their postings.
+        Each term is applied to whole id arrays at once.
+        '''
+        terms = [term for term in set(self.tokenizer(query)) if self.index.get(term)]
+        if not terms or top_k <= 0:
+            return []
+
+        avg_length = self.total_length / len(self.forward) if self.forward else 0.0
+        idf = {term: self._idf(term) for term in terms}
+        min_norm = self.k1 * (1 - self.b) # Length normalization of an empty chunk, the most favourable case.
+        upper = {term: idf[term] * self.max_tf[term] * (self.k1 + 1) / (self.max_tf[term] + min_norm) for term in terms}
+        terms.sort(key=lambda term: upper[term], reverse=True)
+
+        def contribution(term : str, ids : np.ndarray, tfs : np.ndarray) -> np.ndarray:
+            tfs = tfs.astype(np.float64)
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[ids] / avg_length) if avg_length else min_norm
+            return idf[term] * tfs * (self.k1 + 1) / (tfs + norm)
+
+        candidates = np.empty(0, dtype=np.int32) # Sorted ids in the running.
+        scores = np.empty(0, dtype=np.float64)
+        remaining = sum(upper.values())
+        for term in terms:
+            remaining -= upper[term] # Best case still to come from the terms after this one.
+            ids, tfs = self.index[term].arrays()
+            threshold = np.partition(scores, scores.size - top_k)[scores.size - top_k] if scores.size >= top_k else 0.0
+
+            if scores.size >= top_k and threshold > upper[term] + remaining:
+                # No unseen chunk can reach the top_k any more; drop hopeless candidates and probe the rest.
+                hopeful = scores + upper[term] + remaining >= threshold
+                candidates, scores = candidates[hopeful], scores[hopeful]
+                positions = np.minimum(np.searchsorted(ids, candidates), ids.size - 1)
+                hit = ids[positions] == candidates
+                scores[hit] += contribution(term, candidates[hit], tfs[positions[hit]])
+                continue
+
+            if keep is not None:
+                selected = keep[ids]
+                ids, tfs = ids[selected], tfs[selected]
+            merged, inverse = np.unique(np.concatenate([candidates, ids]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores, contribution(term, ids, tfs)]), minlength=merged.size)
+            candidates = merged
+
+        return [(self.registry.key(int(candidates[i])), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+    def delete_chunk(self, chunk_id : str, release : bool = True) -> bool:
         try:
-            # Remove doc id from our set.
-            for lib, doc_id, _ in self.index[term.lower()]:
-                if lib == library_id:
-                    self.docs.remove(doc_id)
-                    break
+            value = self.registry.get(chunk_id)
+            terms = self.forward.pop(value, None) if value is not None else None
+            if terms is None:
+                return False
 
-            self.index[term.lower()] = [(lib, doc_id, cid) for lib, doc_id, cid in self.index[term.lower()] if lib != library_id]
+            # Only the postings of the chunk's own terms are touched.
+            for term in terms:
+                posting = self.index[term]
+                posting.remove(value)
+                if not posting:
+                    del self.index[term]
+                    del self.max_tf[term]
+            self.total_length -= int(self.lengths[value])
+            self.lengths[value] = 0
+            if release and self.owns_registry:
+                self.registry.release(chunk_id)
             return True
         except Exception:
-            print (f"Error occurred when trying to delete library: {traceback.extract_stack()}")
+            print (f"Error occurred when trying to delete chunk: {traceback.extract_stack()}")
             return False
-        
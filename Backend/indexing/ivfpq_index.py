@@ -0,0 +1,193 @@
+from typing import List, Dict, Tuple, Optional
+import copy
+import math
+import numpy as np
+
+from utils.mathUtils import normalize, kmeans, nearest_centroids, top_k_indices
+
+class IVFPQIndex:
+    """
+    Inverted-file index with product-quantized residuals over a single library's embeddings.
+    Vectors are assigned to the nearest of nlist coarse centroids, and the residual is split into
+    num_subspaces slices that are each stored as a one-byte code into a per-slice codebook.
+    Queries score only the nprobe closest lists, using asymmetric distance lookup tables.
+
+    Until enough vectors arrive to train the quantizers, vectors are kept raw and searched exactly.
+    """
+    def __init__(self, nlist : int = 64, num_subspaces : int = 16, nprobe : int = 8, min_train_size : int = 1024, max_train_size : int = 50000, seed : Optional[int] = None):
+        self.nlist = nlist
+        self.num_subspaces = num_subspaces
+        self.codebook_size = 256 # One uint8 code per subspace.
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.max_train_size = max_train_size
+        self.seed = seed
+
+        self.dim = 0
+        self.sub_dim = 0
+        self.coarse : Optional[np.ndarray] = None # (nlist, dim) coarse centroids.
+        self.codebooks : Optional[np.ndarray] = None # (num_subspaces, codebook_size, sub_dim) residual codebooks.
+
+        self.codes = np.zeros((0, num_subspaces), dtype=np.uint8) # row -> PQ code.
+        self.list_of = np.zeros(0, dtype=np.int32) # row -> inverted list.
+        self.count = 0
+        self.lists : List[List[int]] = [] # inverted list -> rows.
+        self.labels : List[Optional[Tuple[str, str]]] = [] # row -> (doc_id, chunk_id), None once deleted.
+        self.row_of : Dict[str, int] = {} # chunk_id -> live row.
+
+        self.pending : Dict[str, Tuple[str, np.ndarray]] = {} # chunk_id -> (doc_id, float16 vector) awaiting training.
+
+    def __len__(self):
+        return len(self.row_of) + len(self.pending)
+
+    def __contains__(self, chunk_id : str):
+        return chunk_id in self.row_of or chunk_id in self.pending
+
+    def copy(self) -> "IVFPQIndex":
+        '''
+        Independent copy, so an updated index can be built while searches keep reading this one.
+        The trained centroids and codebooks are replaced, never modified, so they are shared.
+        '''
+        clone = copy.copy(self)
+        clone.codes = self.codes.copy()
+        clone.list_of = self.list_of.copy()
+        clone.lists = [list(rows) for rows in self.lists]
+        clone.labels = list(self.labels)
+        clone.row_of = dict(self.row_of)
+        clone.pending = dict(self.pending)
+        return clone
+
+    @property
+    def is_trained(self) -> bool:
+        return self.coarse is not None
+
+    def _pad(self, vectors : np.ndarray) -> np.ndarray:
+        # Zero-pad so the dimension splits evenly into subspaces.
+        padded_dim = self.sub_dim * self.num_subspaces
+        if vectors.shape[1] == padded_dim:
+            return vectors
+        return np.pad(vectors, ((0, 0), (0, padded_dim - vectors.shape[1])))
+
+    def _subspaces(self, vectors : np.ndarray) -> np.ndarray:
+        # (n, padded_dim) -> (num_subspaces, n, sub_dim)
+        return self._pad(vectors).reshape(vectors.shape[0], self.num_subspaces, self.sub_dim).transpose(1, 0, 2)
+
+    def train(self, vectors : Optional[np.ndarray] = None):
+        '''
+        Trains the coarse quantizer and residual codebooks with k-means, then encodes every pending vector.
+        Trains on the pending vectors when none are given.
+        '''
+        if vectors is None:
+            vectors = np.stack([vec for _, vec in self.pending.values()]).astype(np.float32)
+        rng = np.random.default_rng(self.seed)
+        if vectors.shape[0] > self.max_train_size:
+            vectors = vectors[rng.choice(vectors.shape[0], self.max_train_size, replace=False)]
+
+        self.dim = vectors.shape[1]
+        self.sub_dim = math.ceil(self.dim / self.num_subspaces)
+        self.coarse = kmeans(vectors, self.nlist, seed=self.seed)
+        self.lists = [[] for _ in range(self.coarse.shape[0])]
+
+        residuals = self._subspaces(vectors - self.coarse[nearest_centroids(vectors, self.coarse)])
+        codebooks = np.zeros((self.num_subspaces, self.codebook_size, self.sub_dim), dtype=np.float32)
+        for s in range(self.num_subspaces):
+            trained = kmeans(residuals[s], self.codebook_size, seed=self.seed)
+            codebooks[s] = trained[np.arange(self.codebook_size) % trained.shape[0]] # Small libraries repeat codewords; encoding picks the first copy.
+        self.codebooks = codebooks
+
+        pending, self.pending = self.pending, {}
+        if pending:
+            self._encode_many([(doc_id, chunk_id) for chunk_id, (doc_id, _) in pending.items()], np.stack([vec for _, vec in pending.values()]).astype(np.float32))
+
+    def _encode_many(self, labels : List[Tuple[str, str]], vectors : np.ndarray):
+        assignment = nearest_centroids(vectors, self.coarse)
+        residuals = self._subspaces(vectors - self.coarse[assignment])
+        codes = np.stack([nearest_centroids(residuals[s], self.codebooks[s]) for s in range(self.num_subspaces)], axis=1).astype(np.uint8)
+
+        needed = self.count + len(labels)
+        if needed > self.codes.shape[0]:
+            capacity = max(1024, self.codes.shape[0] * 2, needed)
+            self.codes = np.resize(self.codes, (capacity, self.num_subspaces))
+            self.list_of = np.resize(self.list_of, capacity)
+
+        for (doc_id, chunk_id), code, list_no in zip(labels, codes, assignment):
+            row = self.count
+            self.count += 1
+            self.codes[row] = code
+            self.list_of[row] = list_no
+            self.lists[list_no].append(row)
+            self.labels.append((doc_id, chunk_id))
+            self.row_of[chunk_id] = row
+
+    @property
+    def needs_training(self) -> bool:
+        return not self.is_trained and len(self.pending) >= self.min_train_size
+
+    def add_many(self, items : List[Tuple[str, str, List[float]]], train : bool = True):
+        '''
+        Adds (doc_id, chunk_id, embedding) items, training the quantizers once enough vectors have arrived.
+        With train=False, training is left to the caller (see needs_training).
+        '''
+        for _, chunk_id, _ in items:
+            self.remove(chunk_id)
+        vectors = np.stack([normalize(emb) for _, _, emb in items]) if items else None
+        if vectors is None:
+            return
+
+        if self.is_trained:
+            self._encode_many([(doc_id, chunk_id) for doc_id, chunk_id, _ in items], vectors)
+            return
+
+        for (doc_id, chunk_id, _), vec in zip(items, vectors.astype(np.float16)):
+            self.pending[chunk_id] = (doc_id, vec) # Only kept until training; half precision is plenty for k-means.
+        if train and self.needs_training:
+            self.train()
+
+    def add(self, doc_id : str, chunk_id : str, embedding : List[float]):
+        self.add_many([(doc_id, chunk_id, embedding)])
+
+    def remove(self, chunk_id : str) -> bool:
+        if self.pending.pop(chunk_id, None) is not None:
+            return True
+        row = self.row_of.pop(chunk_id, None)
+        if row is None:
+            return False
+        self.labels[row] = None
+        self.lists[self.list_of[row]].remove(row)
+        return True
+
+    def search(self, query_embedding : List[float], k : int, nprobe : Optional[int] = None) -> List[Tuple[str, str, float]]:
+        '''
+        Returns up to k (doc_id, chunk_id, similarity) tuples, highest first. Similarities of encoded
+        vectors are approximations derived from the PQ distance (exact while the index is untrained).
+        '''
+        query = normalize(query_embedding)
+        if not self.is_trained:
+            if not self.pending:
+                return []
+            labels = [(doc_id, chunk_id) for chunk_id, (doc_id, _) in self.pending.items()]
+            scores = np.stack([vec for _, vec in self.pending.values()]) @ query # float16 rows are widened by the product.
+            return [(*labels[i], float(scores[i])) for i in top_k_indices(scores, k)]
+
+        nprobe = min(nprobe or self.nprobe, self.coarse.shape[0])
+        probed = top_k_indices(self.coarse @ query - 0.5 * (self.coarse ** 2).sum(axis=1), nprobe) # Closest lists by L2.
+
+        rows = []
+        distances = []
+        for list_no in probed:
+            members = self.lists[list_no]
+            if not members:
+                continue
+            # Lookup table of squared distances between the query residual and every codeword, per subspace.
+            residual = self._subspaces((query - self.coarse[list_no])[None, :])[:, 0, :]
+            table = ((self.codebooks - residual[:, None, :]) ** 2).sum(axis=2)
+            members = np.asarray(members, dtype=np.int64)
+            codes = self.codes[members]
+            distances.append(table[np.arange(self.num_subspaces), codes].sum(axis=1))
+            rows.append(members)
+
+        if not rows:
+            return []
+        rows = np.concatenate(rows)
+        scores = 1 - np.concatenate(distances) / 2 # ||q - x||^2 = 2 - 2 cos for unit vectors.
+        return [(*self.labels[rows[i]], float(scores[i])) for i in top_k_indices(scores, k)]
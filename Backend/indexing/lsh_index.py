@@ -1,77 +1,160 @@
-from typing import List, Dict, Tuple, Set
-import random
+from typing import List, Dict, Tuple, Optional
+from itertools import combinations
+from array import array
+from bisect import bisect_left, insort
+import numpy as np
+
+from indexing.id_registry import IdRegistry
+from utils.metrics import LSH_BUCKET_SIZE
 
-from utils.mathUtils import dot_prod, cosine_similarity
 from Common.schemas.text_chunk import TextChunk
 
 class LSHIndex:
     """
     Approximate nearest neighbor via random hyperplane locality-sensitive hashing.
+    Uses several independent hash tables, and at query time can also probe buckets within a
+    small Hamming distance of the query's own bucket, trading candidate-set size for recall.
+    Bucket keys are the sign bits of each table's projections packed into an integer, and each bucket
+    is partitioned by library so a library-scoped query never reads other libraries' chunks.
+    Buckets hold sorted int32 chunk ids from an IdRegistry, so probing unions them with a single NumPy pass.
     """
-    def __init__(self, num_planes: int = 3):
-        self.num_planes = num_planes
-        self.planes: List[List[float]] = [] # Holds all embeddings.
-        self.buckets: Dict[str, Set[Tuple[str, str]]] = {} # Holds mapping between unique bits to ids.
-        self.docs = set()
+    def __init__(self, num_planes: int = 6, num_tables: int = 4, probe_radius: int = 1, seed: Optional[int] = None, registry: Optional[IdRegistry] = None):
+        self.num_planes = num_planes # Bits per table.
+        self.num_tables = num_tables
+        self.probe_radius = probe_radius # Default Hamming distance probed around the query's bucket.
+        self.seed = seed # Makes freshly drawn planes reproducible when no persisted planes exist.
+        self.planes: Optional[np.ndarray] = None # (num_tables * num_planes, dim) matrix holding the hyperplanes of every table.
+        self.registry = registry if registry is not None else IdRegistry()
+        self.owns_registry = registry is None # A shared registry is released by its owner once every index has dropped the chunk.
+        self.buckets: List[Dict[int, Dict[int, array]]] = [{} for _ in range(num_tables)] # Per table, holds mapping between packed bits to each library index's sorted ids.
+        self.chunk_keys: Dict[int, Tuple[int, ...]] = {} # id -> bucket key per table.
+
+        self._bit_weights = 1 << np.arange(num_planes, dtype=np.int64) # Packs a table's bits into one integer key.
+        self._probe_masks: Dict[int, List[int]] = {} # Cached XOR masks per probe radius.
 
         # Will initialize planes when first embedding arrives
-    
+
     def _init_planes(self, dim: int):
-        # random hyperplanes with gaussian distribution
-        self.planes = [[random.gauss(0,1) for _ in range(dim)] for _ in range(self.num_planes)]
-
-    def _hash(self, emb: List[float]) -> str:
-        if not self.planes:
-            self._init_planes(len(emb)) # Initialize random noise for embedding comparison.
-        bits = [] # Stores bits, which determines which plane is most similar.
-        for plane in self.planes:
-            dot = dot_prod(emb, plane) # Finds similarity between each plane and the text embedding.
-            bits.append('1' if dot >= 0 else '0')
-        return ''.join(bits)
+        # random hyperplanes with gaussian distribution, drawn independently for each table
+        self.planes = np.random.default_rng(self.seed).standard_normal((self.num_tables * self.num_planes, dim)).astype(np.float32)
+
+    def load_planes(self, planes: np.ndarray) -> bool:
+        '''
+        Restores previously persisted hyperplanes. Returns False (and keeps the current planes) when
+        they were drawn for a different table layout.
+        '''
+        if planes.shape[0] != self.num_tables * self.num_planes:
+            return False
+        self.planes = np.asarray(planes, dtype=np.float32)
+        return True
+
+    def hash_many(self, embeddings) -> np.ndarray:
+        '''
+        Hashes a batch of embeddings with a single matrix product.
+        Returns an (n, num_tables) array of integer bucket keys.
+        '''
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[None, :]
+        if embeddings.shape[0] == 0:
+            return np.empty((0, self.num_tables), dtype=np.int64)
+        if self.planes is None:
+            self._init_planes(embeddings.shape[1]) # Initialize random noise for embedding comparison.
+
+        bits = (embeddings @ self.planes.T >= 0).reshape(-1, self.num_tables, self.num_planes)
+        return bits @ self._bit_weights
+
+    def _hash(self, emb: List[float]) -> List[int]:
+        return self.hash_many(emb)[0].tolist()
+
+    def _masks(self, radius: int) -> List[int]:
+        '''
+        Returns the XOR masks of every key within the given Hamming distance, closest first (0 is the key itself).
+        '''
+        if radius not in self._probe_masks:
+            masks = [0]
+            for distance in range(1, min(radius, self.num_planes) + 1):
+                for positions in combinations(range(self.num_planes), distance):
+                    masks.append(sum(1 << pos for pos in positions))
+            self._probe_masks[radius] = masks
+        return self._probe_masks[radius]
+
+    def add_hashed(self, library_id : str, doc_id: str, chunk_id: str, keys: List[int]):
+        self._unhash(chunk_id) # A re-added chunk may hash to different buckets than before.
+        value = self.registry.intern(library_id, doc_id, chunk_id)
+        library = int(self.registry.library_of[value])
+        keys = tuple(int(h) for h in keys)
+        for table, h in zip(self.buckets, keys):
+            insort(table.setdefault(h, {}).setdefault(library, array("i")), value) # Stores packed bits as unique identifier in buckets.
+        self.chunk_keys[value] = keys
 
     def add_chunk(self, library_id : str, doc_id: str, chunk: TextChunk):
-        h = self._hash(chunk.embeddings)
-        self.docs.add(doc_id)
-        self.buckets.setdefault(h, set([])).add((library_id, doc_id, chunk.id)) # Stores bits as unique identifier in buckets.
-
-    def query_bucket(self, query_emb: List[float]) -> Set[Tuple[str, str, str]]:
-        h = self._hash(query_emb) # Gets the unique identifier for the bucket.
-        print(f"Bucket of size: {len(self.buckets)}")
-        print(f"Result: {self.buckets.get(h, [])}")
-        return self.buckets.get(h, set([]))
-    
-    def delete_chunk(self, chunk_id : str, embedding : List[float]):
-        hash_code = self._hash(embedding)
-
-        if hash_code in self.buckets:
-            for _, doc_id, cid in self.buckets[hash_code]:
-                if cid == chunk_id:
-                    self.docs.remove(doc_id)
-                    break
-
-            # Filter bucket, remove any content with the specific chunk id.
-            self.buckets[hash_code] = set([(lib, doc, cid)
-            for (lib, doc, cid) in self.buckets[hash_code]
-            if cid != chunk_id
-            ])
-        
-            self.clean_up(hash_code)
-    
-    def delete_library(self, library_id : str, embedding : List[float]):
-        hash_code = self._hash(embedding)
-        if hash_code in self.buckets:
-            for lib_id, doc_id, _ in self.buckets[hash_code]:
-                if lib_id == library_id:
-                    if doc_id in self.docs: self.docs.remove(doc_id)
-                    break
-            # Filter bucket, remove any content with the specific chunk id.
-            self.buckets[hash_code] = [(lib, doc, cid)
-            for (lib, doc, cid) in self.buckets[hash_code]
-            if lib != library_id
-            ]
-
-            self.clean_up(hash_code)
-
-    def clean_up(self, hash_code : str):
-        if not self.buckets[hash_code]:
-                del self.buckets[hash_code] # Remove any empty buckets.
\ No newline at end of file
+        self.add_hashed(library_id, doc_id, chunk.id, self._hash(chunk.embeddings))
+
+    def query_bucket(self, query_emb: List[float], probe_radius: Optional[int] = None, num_tables: Optional[int] = None, library_ids: Optional[List[str]] = None) -> np.ndarray:
+        '''
+        Unions the candidates of the query's bucket (and its Hamming neighbours) across the first num_tables tables.
+        Returns their sorted registry ids. When library_ids is given, only those libraries' share of each bucket is read.
+        '''
+        return self.probe(self._hash(query_emb), probe_radius, num_tables, library_ids)
+
+    def query_buckets(self, query_embs, probe_radius: Optional[int] = None, num_tables: Optional[int] = None, library_ids: Optional[List[str]] = None) -> List[np.ndarray]:
+        '''
+        query_bucket for a batch of queries, hashed with a single matrix product.
+        '''
+        return [self.probe(keys, probe_radius, num_tables, library_ids) for keys in self.hash_many(query_embs).tolist()]
+
+    def probe(self, keys: List[int], probe_radius: Optional[int] = None, num_tables: Optional[int] = None, library_ids: Optional[List[str]] = None) -> np.ndarray:
+        radius = self.probe_radius if probe_radius is None else probe_radius
+        tables = self.num_tables if num_tables is None else max(1, min(num_tables, self.num_tables))
+        libraries = None if library_ids is None else [self.registry.library_index[library_id] for library_id in library_ids if library_id in self.registry.library_index]
+
+        shares = [] # Every library share read, unioned in one pass at the end.
+        sizes = [] # Ids read from each non-empty bucket, recorded once per probe.
+        masks = self._masks(radius)
+        for table, h in list(zip(self.buckets, keys))[:tables]:
+            for mask in masks:
+                bucket = table.get(h ^ mask)
+                if not bucket:
+                    continue
+                read = list(bucket.values()) if libraries is None else [bucket[index] for index in libraries if index in bucket]
+                shares.extend(read)
+                sizes.append(sum(len(ids) for ids in read))
+        LSH_BUCKET_SIZE.observe_many(sizes)
+
+        if not shares:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate([np.frombuffer(ids, dtype=np.int32) for ids in shares]))
+
+    def delete_chunk(self, chunk_id : str) -> bool:
+        '''
+        Removes a chunk from the bucket it occupies in each table, found through the forward map without re-hashing.
+        '''
+        removed = self._unhash(chunk_id)
+        if removed and self.owns_registry:
+            self.registry.release(chunk_id)
+        return removed
+
+    def _unhash(self, chunk_id : str) -> bool:
+        value = self.registry.get(chunk_id)
+        keys = self.chunk_keys.pop(value, None) if value is not None else None
+        if keys is None:
+            return False
+
+        library = int(self.registry.library_of[value])
+        for table_no, hash_code in enumerate(keys):
+            ids = self.buckets[table_no].get(hash_code, {}).get(library)
+            if ids is None:
+                continue
+            position = bisect_left(ids, value)
+            if position < len(ids) and ids[position] == value:
+                del ids[position]
+            self.clean_up(table_no, hash_code, library)
+        return True
+
+    def clean_up(self, table_no : int, hash_code : int, library : int):
+        bucket = self.buckets[table_no][hash_code]
+        if not bucket[library]:
+            del bucket[library]
+        if not bucket:
+                del self.buckets[table_no][hash_code] # Remove any empty buckets.
@@ -0,0 +1,62 @@
+from typing import List, Dict, Tuple, Set, Optional, Union
+
+class MetadataIndex:
+    """
+    Inverted index from metadata (field, value) pairs and document ids to the embedding store rows of a library's chunks.
+    Filters are answered by intersecting row sets, smallest first, so candidates can be restricted before anything is scored.
+    A forward map from row to its postings lets removals touch only that chunk's entries.
+    """
+    def __init__(self):
+        self.postings: Dict[Tuple[str, str], Set[int]] = {} # (field, value) -> rows.
+        self.documents: Dict[str, Set[int]] = {} # doc_id -> rows.
+        self.forward: Dict[int, Tuple[str, Tuple[Tuple[str, str], ...]]] = {} # row -> (doc_id, (field, value) pairs).
+
+    def __len__(self):
+        return len(self.forward)
+
+    def add(self, row : int, doc_id : str, metadata : Dict[str, str]):
+        self.remove(row) # Re-adding a row replaces its previous postings.
+
+        pairs = tuple(metadata.items())
+        for pair in pairs:
+            self.postings.setdefault(pair, set()).add(row)
+        self.documents.setdefault(doc_id, set()).add(row)
+        self.forward[row] = (doc_id, pairs)
+
+    def remove(self, row : int) -> bool:
+        entry = self.forward.pop(row, None)
+        if entry is None:
+            return False
+
+        doc_id, pairs = entry
+        for pair in pairs:
+            self._discard(self.postings, pair, row)
+        self._discard(self.documents, doc_id, row)
+        return True
+
+    @staticmethod
+    def _discard(postings : dict, key, row : int):
+        rows = postings[key]
+        rows.discard(row)
+        if not rows:
+            del postings[key] # Remove any empty postings.
+
+    def match(self, document_id : Optional[str] = None, filters : Optional[Dict[str, Union[str, List[str]]]] = None) -> Set[int]:
+        '''
+        Returns the rows whose document and metadata satisfy every constraint.
+        A string filter value requires equality; a list accepts any of its values.
+        '''
+        constraints = []
+        if document_id is not None:
+            constraints.append(self.documents.get(document_id, set()))
+        for field, value in (filters or {}).items():
+            values = [value] if isinstance(value, str) else value
+            if len(values) == 1:
+                constraints.append(self.postings.get((field, values[0]), set()))
+            else:
+                constraints.append(set().union(*(self.postings.get((field, v), ()) for v in values)))
+
+        if not constraints:
+            return set(self.forward)
+        constraints.sort(key=len)
+        return constraints[0].intersection(*constraints[1:])
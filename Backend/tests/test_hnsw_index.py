@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+# Backend modules import each other from the Backend directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indexing.hnsw_index import HNSWIndex
+
+class HNSWIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.vectors = self.rng.standard_normal((300, 16)).astype(np.float32)
+
+    def _index(self, **params) -> HNSWIndex:
+        index = HNSWIndex(M=8, ef_construction=64, ef_search=16, seed=0, **params)
+        for i, vector in enumerate(self.vectors):
+            index.add("doc", f"chunk-{i}", vector)
+        return index
+
+    def _assert_full_results(self, index : HNSWIndex):
+        for k in (1, 10, 50, 500):
+            results = index.search(self.rng.standard_normal(16), k)
+            self.assertEqual(len(results), min(k, len(index)))
+            self.assertEqual(len({chunk_id for _, chunk_id, _ in results}), len(results))
+
+    def test_readding_unchanged_chunks_keeps_their_nodes(self):
+        index = self._index()
+        for _ in range(5):
+            # What update_library does for a library whose chunks did not change.
+            for i, vector in enumerate(self.vectors):
+                index.add("doc", f"chunk-{i}", vector)
+        self.assertEqual(index.count, len(self.vectors))
+        self.assertFalse(index.deleted)
+        self._assert_full_results(index)
+
+    def test_search_returns_min_k_live_after_updates(self):
+        index = self._index()
+        for _ in range(5):
+            self.vectors = self.rng.standard_normal(self.vectors.shape).astype(np.float32)
+            for i, vector in enumerate(self.vectors):
+                index.add("doc", f"chunk-{i}", vector)
+        self.assertEqual(len(index), len(self.vectors))
+        self._assert_full_results(index) # 1500 soft-deleted nodes crowd the beam; search widens it until k are live.
+
+        self.assertTrue(index.needs_compaction)
+        compacted = index.compacted()
+        self.assertEqual(compacted.count, len(self.vectors))
+        self._assert_full_results(compacted)
+
+    def test_search_returns_min_k_live_after_deletes(self):
+        index = self._index()
+        for i in range(0, len(self.vectors), 3):
+            index.remove(f"chunk-{i}")
+        self.assertEqual(len(index), 200)
+        self._assert_full_results(index)
+
+        removed = {f"chunk-{i}" for i in range(0, len(self.vectors), 3)}
+        found = {chunk_id for _, chunk_id, _ in index.search(self.vectors[0], 500)}
+        self.assertFalse(found & removed)
+
+    def test_compaction_drops_deleted_nodes(self):
+        index = self._index()
+        for i in range(250):
+            index.remove(f"chunk-{i}")
+        compacted = index.compacted()
+        self.assertEqual(len(index), 50) # Compaction builds a new graph; the old one is left as it was.
+        self.assertEqual(compacted.count, 50)
+        self.assertFalse(compacted.deleted)
+        self.assertFalse(compacted.needs_compaction)
+        self._assert_full_results(compacted)
+
+        nearest = compacted.search(self.vectors[260], 1)[0]
+        self.assertEqual(nearest[1], "chunk-260")
+
+if __name__ == "__main__":
+    unittest.main()
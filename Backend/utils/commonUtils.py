@@ -1,4 +1,7 @@
-from typing import List, Dict
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import base64
+
+from data.library_store import ChunkView
 
 from Common.schemas.document import Document
 from Common.schemas.text_chunk import TextChunk
@@ -8,4 +11,44 @@ def get_docid_chunk_dict(documents : List[Document]) -> Dict[str, List[TextChunk
     for doc in documents:
         chunks.setdefault(doc.id, [chunk for chunk in doc.chunks.values()])
     
-    return chunks
\ No newline at end of file
+    return chunks
+
+def project_chunk(library_id : str, doc_id : str, chunk : ChunkView, fields : List[str], score : Optional[float] = None, scores : Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    '''
+    Builds a search result holding only the requested fields of the chunk (plus "score", and hybrid search's per-retriever "scores"),
+    so unrequested fields are never read from the store or serialized.
+    '''
+    values = {"document_id": doc_id, "library_id": library_id, "score": score, "scores": scores}
+    result = {}
+    for field in fields:
+        if field in values:
+            result[field] = values[field]
+        elif field == "embeddings":
+            result[field] = chunk.embeddings.tolist()
+        else:
+            result[field] = getattr(chunk, field)
+    return result
+
+def encode_cursor(offset : int, last_id : str) -> str:
+    return base64.urlsafe_b64encode(f"{offset}:{last_id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor : str) -> Tuple[int, str]:
+    offset, last_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split(":", 1)
+    return int(offset), last_id
+
+def paginate(items : Sequence[Tuple[str, Any]], limit : int, cursor : Optional[str] = None) -> Tuple[List[Any], Optional[str]]:
+    '''
+    Returns up to limit values of the (id, value) items following the cursor, and the cursor of the next page (None on the last page).
+    A cursor holds the offset and id of the last item served. If earlier items were deleted since, the page resumes right after that id.
+    '''
+    start = 0
+    if cursor:
+        offset, last_id = decode_cursor(cursor)
+        if 0 < offset <= len(items) and items[offset - 1][0] == last_id:
+            start = offset
+        else:
+            start = next((i + 1 for i, (key, _) in enumerate(items) if key == last_id), min(offset, len(items)))
+
+    page = items[start:start + limit]
+    next_cursor = encode_cursor(start + len(page), page[-1][0]) if page and start + len(page) < len(items) else None
+    return [value for _, value in page], next_cursor
\ No newline at end of file
@@ -1,17 +1,45 @@
+import time
 import cohere
 from sentence_transformers import SentenceTransformer
 from abc import ABC, abstractmethod
+from typing import List, Dict
 
 class BaseEmbedder(ABC):
     def __init__(self, api_key : str = "", model : str = "", input_type : str = ""):
         self.api_key = api_key
         self.model = model
         self.input_type = input_type
+        self.last_batch_stats : List[Dict[str, float]] = [] # Per-batch size, seconds and texts/sec of the last embed_batched call.
     
     @abstractmethod
     def embed(self, texts : list[str]):
         pass
 
+    def embed_batch(self, texts : List[str]) -> List[List[float]]:
+        '''
+        Embeds a list of texts in one call, returning one embedding per text.
+        Embedders that support batched inference should override this.
+        '''
+        return [self.embed(text) for text in texts]
+
+    def embed_batched(self, texts : List[str], batch_size : int = 64) -> List[List[float]]:
+        '''
+        Embeds any number of texts in batches of batch_size, returning embeddings in input order.
+        Texts are sorted by length first so each batch holds similarly sized inputs and pads as little as possible.
+        '''
+        embeddings : List[List[float]] = [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        self.last_batch_stats = []
+
+        for offset in range(0, len(order), batch_size):
+            batch = order[offset:offset + batch_size]
+            batch_start = time.perf_counter()
+            for i, embedding in zip(batch, self.embed_batch([texts[i] for i in batch])):
+                embeddings[i] = embedding
+            seconds = time.perf_counter() - batch_start
+            self.last_batch_stats.append({"size": len(batch), "seconds": seconds, "texts_per_second": len(batch) / seconds if seconds else 0.0})
+        return embeddings
+
 class CohereEmbedder(BaseEmbedder):
     def __init__(self, api_key : str = ""):
         '''
@@ -31,13 +59,21 @@ class CohereEmbedder(BaseEmbedder):
     
         return res.embeddings
 
+    def embed_batch(self, texts : List[str]) -> List[List[float]]:
+        return list(self.embed(texts).float_)
+
 class SentenceTransformerEmbedder(BaseEmbedder):
-    def __init__(self, model = "BAAI/bge-small-en-v1.5"):
+    def __init__(self, model = "BAAI/bge-small-en-v1.5", max_batch_size : int = 64):
         '''
         Uses sentence_transformers to embed text instead of cohere.
         '''
         super().__init__(model = model)
         self.encoder = SentenceTransformer(model)
+        self.max_batch_size = max_batch_size # Texts per forward pass, however many one call passes in.
     
     def embed(self, texts : list[str]):
         return self.encoder.encode(texts, normalize_embeddings=True).squeeze().tolist()
+
+    def embed_batch(self, texts : List[str]) -> List[List[float]]:
+        # No squeeze here, so a single-text batch still returns a list of embeddings.
+        return self.encoder.encode(texts, batch_size=max(1, min(len(texts), self.max_batch_size)), normalize_embeddings=True).tolist()
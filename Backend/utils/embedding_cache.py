@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from typing import List, Dict
+import hashlib
+import json
+import threading
+import numpy as np
+
+from utils.embedder import BaseEmbedder
+from utils.embedding_codec import encode_embedding, decode_embedding
+
+class CachedEmbedder(BaseEmbedder):
+    def __init__(self, embedder : BaseEmbedder, max_entries : int = 10000, db = None):
+        '''
+        Content-addressed cache in front of another embedder. Embeddings are keyed by a hash of
+        the model name and text, kept in a bounded in-memory LRU, and optionally persisted to the
+        embedding_cache table of the given DB so they survive restarts.
+        '''
+        super().__init__(embedder.api_key, embedder.model, embedder.input_type)
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.db = db
+        self.lru : OrderedDict[str, np.ndarray] = OrderedDict() # float32 vectors: 1.5 KB per 384-dim entry, against ~12 KB as a list of floats.
+        self.lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _key(self, text : str) -> str:
+        return hashlib.sha256(f"{self.model}\0{self.input_type}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key : str, embedding : np.ndarray):
+        with self.lock:
+            self.lru[key] = embedding
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.max_entries:
+                self.lru.popitem(last=False) # Evict the least recently used entry.
+
+    def _lookup(self, keys : List[str]) -> Dict[str, np.ndarray]:
+        '''
+        Returns the cached embeddings of the given distinct keys, checking memory first and then the DB in a single query.
+        '''
+        found = {}
+        with self.lock:
+            for key in keys:
+                embedding = self.lru.get(key)
+                if embedding is not None:
+                    self.lru.move_to_end(key)
+                    found[key] = embedding
+            self.memory_hits += len(found)
+
+        unseen = [key for key in keys if key not in found]
+        if self.db is not None and unseen:
+            for key, blob in self.db.fetch_proc("pr_select_embedding_cache.sql", (json.dumps(unseen),)):
+                found[key] = decode_embedding(blob)
+                self._remember(key, found[key])
+
+        with self.lock:
+            self.disk_hits += len(found) - (len(keys) - len(unseen))
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _store(self, entries : Dict[str, np.ndarray]):
+        for key, embedding in entries.items():
+            self._remember(key, embedding)
+        if self.db is not None and entries:
+            # Fire and forget: the caller never waits on the writer, and a lost upsert only costs a later re-embed.
+            self.db.submit_proc("pr_batch_upsert_embedding_cache.sql", [(key, encode_embedding(embedding)) for key, embedding in entries.items()])
+
+    def _resolve(self, texts : List[str]):
+        '''
+        Returns the cached embeddings (None where missing), each text's key, and the distinct texts that missed.
+        '''
+        keys = [self._key(text) for text in texts]
+        texts_of = dict(zip(keys, texts)) # Duplicate texts are looked up and embedded once.
+        found = self._lookup(list(texts_of))
+        missing : Dict[str, str] = {key: text for key, text in texts_of.items() if key not in found} # key -> text
+        return found, keys, missing
+
+    @staticmethod
+    def _vectors(missing : Dict[str, str], embeddings : List[List[float]]) -> Dict[str, np.ndarray]:
+        return {key: np.asarray(embedding, dtype=np.float32) for key, embedding in zip(missing, embeddings)}
+
+    def embed(self, texts : list[str]):
+        if isinstance(texts, str):
+            return self.embed_batch([texts])[0]
+        return self.embed_batch(texts)
+
+    def embed_batch(self, texts : List[str]) -> List[List[float]]:
+        found, keys, missing = self._resolve(texts)
+        if missing:
+            computed = self._vectors(missing, self.embedder.embed_batch(list(missing.values())))
+            self._store(computed)
+            found.update(computed)
+        return [found[key].tolist() for key in keys] # Callers get lists; only the returned texts are converted.
+
+    def embed_batched(self, texts : List[str], batch_size : int = 64) -> List[List[float]]:
+        found, keys, missing = self._resolve(texts)
+        if missing:
+            # Only the misses go through the wrapped embedder's length-bucketed batching.
+            computed = self._vectors(missing, self.embedder.embed_batched(list(missing.values()), batch_size))
+            self.last_batch_stats = self.embedder.last_batch_stats
+            self._store(computed)
+            found.update(computed)
+        else:
+            self.last_batch_stats = []
+        return [found[key].tolist() for key in keys]
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses, "entries": len(self.lru)}
@@ -0,0 +1,44 @@
+from typing import List, Union
+import io
+import pickle
+import numpy as np
+
+# Versioned BLOB layout: b"VE" magic, one version byte, one dtype byte, then the raw little-endian vector.
+MAGIC = b"VE"
+VERSION = 1
+HEADER_SIZE = 4
+DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+DTYPE_CODES = {"float32": 1, "float16": 2}
+
+def encode_embedding(embedding : Union[List[float], np.ndarray], dtype : str = "float32") -> bytes:
+    '''
+    Serializes an embedding as a header plus raw little-endian float32 (or float16) values.
+    '''
+    code = DTYPE_CODES[dtype]
+    return MAGIC + bytes([VERSION, code]) + np.asarray(embedding, dtype=DTYPES[code]).tobytes()
+
+def is_encoded(blob : bytes) -> bool:
+    return bytes(blob[:2]) == MAGIC
+
+def decode_embedding(blob : bytes) -> np.ndarray:
+    '''
+    Decodes a BLOB written by encode_embedding. float32 payloads are returned as a zero-copy view of the buffer;
+    float16 payloads are widened to float32.
+    '''
+    if not is_encoded(blob):
+        raise ValueError("Embedding BLOB is not in the binary embedding format; run the pickle migration first.")
+    if blob[2] != VERSION:
+        raise ValueError(f"Unsupported embedding BLOB version {blob[2]}")
+    values = np.frombuffer(blob, dtype=DTYPES[blob[3]], offset=HEADER_SIZE)
+    return values if values.dtype == np.float32 else values.astype(np.float32)
+
+class _PlainDataUnpickler(pickle.Unpickler):
+    # Legacy BLOBs are pickled lists of floats, which never reference globals; refusing them keeps loading safe.
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from a legacy embedding BLOB")
+
+def decode_legacy_embedding(blob : bytes) -> np.ndarray:
+    '''
+    Decodes a pickled List[float] embedding written before the binary format existed.
+    '''
+    return np.asarray(_PlainDataUnpickler(io.BytesIO(blob)).load(), dtype=np.float32)
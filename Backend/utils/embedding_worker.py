@@ -0,0 +1,122 @@
+from concurrent.futures import Future
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import queue
+import threading
+import time
+
+from utils.embedder import BaseEmbedder
+
+class EmbeddingWorker(BaseEmbedder):
+    def __init__(self, embedder : BaseEmbedder, max_batch_size : int = 32, max_wait_ms : float = 5.0):
+        '''
+        Runs every call of the wrapped embedder on one dedicated worker thread, coalescing concurrent requests.
+        Requests arriving within max_wait_ms of the oldest waiting one (up to max_batch_size texts) are encoded
+        in a single forward pass and their results fanned back to each caller. Encoder passes never run on request
+        threads or the event loop, and the encoder releases the GIL during inference, so other requests keep running.
+        '''
+        super().__init__(embedder.api_key, embedder.model, embedder.input_type)
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000 # Latency budget a request may spend waiting for others to join its batch.
+        self.queue : "queue.Queue[Optional[Tuple[List[str], Optional[int], Future, float]]]" = queue.Queue() # (texts, batch_size for embed_batched runs, future, enqueue time).
+        self.lock = threading.Lock()
+
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.largest_batch = 0
+        self.wait_seconds = 0.0 # Summed time requests spent queued before their batch started.
+
+        self.thread = threading.Thread(target=self._run, name="embedder", daemon=True)
+        self.thread.start()
+
+    def submit(self, texts : List[str], batch_size : Optional[int] = None) -> Future:
+        future = Future()
+        self.queue.put((list(texts), batch_size, future, time.perf_counter()))
+        return future
+
+    async def embed_async(self, texts : List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def embed(self, texts : list[str]):
+        if isinstance(texts, str):
+            return self.embed_batch([texts])[0]
+        return self.embed_batch(texts)
+
+    def embed_batch(self, texts : List[str]) -> List[List[float]]:
+        return self.submit(texts).result()
+
+    def embed_batched(self, texts : List[str], batch_size : int = 64) -> List[List[float]]:
+        # Bulk runs keep their own length-bucketed batching and are never merged with query requests.
+        embeddings = self.submit(texts, batch_size).result()
+        self.last_batch_stats = self.embedder.last_batch_stats
+        return embeddings
+
+    def _run(self):
+        deferred = None
+        while True:
+            request = deferred if deferred is not None else self.queue.get()
+            deferred = None
+            if request is None:
+                return
+
+            texts, batch_size, future, _ = request
+            if batch_size is not None:
+                self._complete([request], lambda: self.embedder.embed_batched(texts, batch_size))
+                continue
+
+            # Gather whatever else arrives within the oldest request's latency budget.
+            batch = [request]
+            count = len(texts)
+            deadline = request[3] + self.max_wait
+            while count < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    pending = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if pending is None or pending[1] is not None:
+                    deferred = pending # Shutdown and bulk runs are handled after this batch.
+                    break
+                batch.append(pending)
+                count += len(pending[0])
+
+            self._complete(batch, lambda: self.embedder.embed_batch([text for pending in batch for text in pending[0]]))
+
+    def _complete(self, batch : list, encode):
+        start = time.perf_counter()
+        with self.lock:
+            self.batches += 1
+            self.requests += len(batch)
+            size = sum(len(texts) for texts, _, _, _ in batch)
+            self.texts += size
+            self.largest_batch = max(self.largest_batch, size)
+            self.wait_seconds += sum(start - enqueued for _, _, _, enqueued in batch)
+
+        try:
+            embeddings = encode()
+        except Exception as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for texts, _, future, _ in batch:
+            future.set_result(embeddings[offset:offset + len(texts)])
+            offset += len(texts)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "texts": self.texts,
+                "largest_batch": self.largest_batch,
+                "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "mean_wait_ms": 1000 * self.wait_seconds / self.requests if self.requests else 0.0,
+            }
+
+    def shutdown(self):
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,43 @@
+from typing import Dict, List, Tuple, Hashable
+
+# A ranking is a best-first list of (id, score) pairs from one retriever.
+Ranking = List[Tuple[Hashable, float]]
+
+def _per_source_scores(rankings : Dict[str, Ranking]) -> Dict[Hashable, Dict[str, float]]:
+    scores : Dict[Hashable, Dict[str, float]] = {}
+    for source, ranking in rankings.items():
+        for key, score in ranking:
+            scores.setdefault(key, {})[source] = score
+    return scores
+
+def reciprocal_rank_fusion(rankings : Dict[str, Ranking], k : int = 60) -> List[Tuple[Hashable, float, Dict[str, float]]]:
+    '''
+    Fuses rankings by summing 1 / (k + rank) over every ranking an id appears in.
+    Returns (id, fused score, {source: original score}) tuples, best first.
+    '''
+    fused : Dict[Hashable, float] = {}
+    for ranking in rankings.values():
+        for rank, (key, _) in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+
+    per_source = _per_source_scores(rankings)
+    return sorted(((key, score, per_source[key]) for key, score in fused.items()), key=lambda item: item[1], reverse=True)
+
+def weighted_score_fusion(rankings : Dict[str, Ranking], weights : Dict[str, float]) -> List[Tuple[Hashable, float, Dict[str, float]]]:
+    '''
+    Min-max normalizes each ranking's scores to [0, 1] and sums them with the given per-source weights.
+    Ids missing from a ranking contribute 0 for that source.
+    Returns (id, fused score, {source: original score}) tuples, best first.
+    '''
+    fused : Dict[Hashable, float] = {}
+    for source, ranking in rankings.items():
+        if not ranking:
+            continue
+        scores = [score for _, score in ranking]
+        low, high = min(scores), max(scores)
+        for key, score in ranking:
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[key] = fused.get(key, 0.0) + weights.get(source, 1.0) * normalized
+
+    per_source = _per_source_scores(rankings)
+    return sorted(((key, score, per_source[key]) for key, score in fused.items()), key=lambda item: item[1], reverse=True)
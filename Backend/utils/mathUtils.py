@@ -10,4 +10,77 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 def dot_prod(vec1 : List[float], vec2 : List[float]) -> float:
-    return np.dot(np.array(vec1), np.array(vec2))
\ No newline at end of file
+    return np.dot(np.array(vec1), np.array(vec2))
+
+def normalize(vec) -> np.ndarray:
+    '''
+    Returns a float32 copy of the vector scaled to unit length. Zero vectors are returned unchanged.
+    '''
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    if norm == 0:
+        return arr
+    return arr / norm
+
+def normalize_rows(matrix) -> np.ndarray:
+    '''
+    Returns a float32 copy of the matrix with every row scaled to unit length. Zero rows are left unchanged.
+    '''
+    arr = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    return arr / np.where(norms == 0, 1, norms)
+
+def top_k_indices(scores : np.ndarray, k : int) -> np.ndarray:
+    '''
+    Returns the indices of the k largest scores, ordered from highest to lowest.
+    Uses argpartition so only the selected k entries are fully sorted.
+    '''
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.size)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+def top_k_rows(scores : np.ndarray, k : int) -> np.ndarray:
+    '''
+    Row-wise top_k_indices: for every row, the column indices of its k largest scores, highest first.
+    '''
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
+
+def nearest_centroids(data : np.ndarray, centroids : np.ndarray) -> np.ndarray:
+    '''
+    Index of the closest centroid (squared L2) for every row of data.
+    '''
+    distances = (centroids ** 2).sum(axis=1)[None, :] - 2 * (data @ centroids.T)
+    return np.argmin(distances, axis=1)
+
+def kmeans(data : np.ndarray, k : int, iterations : int = 20, seed = None) -> np.ndarray:
+    '''
+    Lloyd's k-means over the rows of data. Returns a (k, dim) float32 centroid matrix.
+    Empty clusters are re-seeded from random points so every centroid stays in use.
+    '''
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, data.shape[0])
+    centroids = data[rng.choice(data.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(data, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(data.shape[0], int(empty.sum()), replace=False)]
+    return centroids
@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+from typing import List, Dict, Tuple, Callable, Iterable
+from bisect import bisect_left
+import threading
+import time
+
+# Latency buckets (seconds) spanning sub-millisecond index probes to multi-second bulk encodes.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Size buckets for bucket occupancy and candidate counts.
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 100000)
+
+def _labels(names : Tuple[str, ...], values : Tuple[str, ...], extra : str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value : float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name : str, description : str, labels : Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values : Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount : float = 1, *labels : str):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = sorted(self.values.items())
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in values]
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus layout: per label set, a count per upper bound, a sum and a total count.
+    """
+    def __init__(self, name : str, description : str, buckets : Iterable[float] = LATENCY_BUCKETS, labels : Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.bounds = tuple(sorted(buckets))
+        self.labels = labels
+        self.series : Dict[Tuple[str, ...], List] = {} # labels -> [per-bucket counts (+Inf last), sum, count].
+        self.lock = threading.Lock()
+
+    def _series(self, labels : Tuple[str, ...]) -> List:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+        return series
+
+    def observe(self, value : float, *labels : str):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            series = self._series(labels)
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def observe_many(self, values : Iterable[float], *labels : str):
+        # One lock acquisition for a whole batch of observations.
+        indexes = [(bisect_left(self.bounds, value), value) for value in values]
+        with self.lock:
+            series = self._series(labels)
+            for index, value in indexes:
+                series[0][index] += 1
+                series[1] += value
+            series[2] += len(indexes)
+
+    def render(self) -> List[str]:
+        with self.lock:
+            snapshot = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self.series.items())
+
+        lines = []
+        for key, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+class Registry:
+    """
+    Holds every metric and renders them in the Prometheus text exposition format.
+    Callbacks expose values that already live elsewhere (cache and worker statistics) without double counting.
+    """
+    def __init__(self):
+        self.metrics : Dict[str, Tuple[str, object]] = {} # name -> (type, metric).
+        self.callbacks : Dict[str, Tuple[str, str, Tuple[str, ...], Callable[[], Dict[Tuple[str, ...], float]]]] = {} # name -> (type, description, labels, read values).
+
+    def counter(self, name : str, description : str, labels : Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, description, labels)
+        self.metrics[name] = ("counter", metric)
+        return metric
+
+    def histogram(self, name : str, description : str, buckets : Iterable[float] = LATENCY_BUCKETS, labels : Tuple[str, ...] = ()) -> Histogram:
+        metric = Histogram(name, description, buckets, labels)
+        self.metrics[name] = ("histogram", metric)
+        return metric
+
+    def callback(self, name : str, description : str, kind : str, read : Callable[[], Dict[Tuple[str, ...], float]], labels : Tuple[str, ...] = ()):
+        self.callbacks[name] = (kind, description, labels, read)
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, metric) in self.metrics.items():
+            lines += [f"# HELP {name} {metric.description}", f"# TYPE {name} {kind}"]
+            lines += metric.render()
+        for name, (kind, description, labels, read) in self.callbacks.items():
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_labels(labels, key)} {_number(value)}" for key, value in sorted(read().items())]
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("vectordb_stage_seconds", "Wall time spent in each request stage.", labels=("stage",))
+LSH_BUCKET_SIZE = REGISTRY.histogram("vectordb_lsh_bucket_size", "Candidates held by each non-empty LSH bucket probed by a query.", SIZE_BUCKETS)
+CANDIDATES = REGISTRY.histogram("vectordb_candidates", "Candidates an engine handed to exact rescoring per query and library set.", SIZE_BUCKETS, ("engine",))
+SEARCHES = REGISTRY.counter("vectordb_searches_total", "Searches served, by mode.", ("mode",))
+
+@contextmanager
+def timed(stage : str):
+    '''
+    Records the wall time of the block in STAGE_SECONDS under the given stage label.
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage)
@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+import threading
+
+class RWLock:
+    """
+    Readers-writer lock: any number of readers may hold it together, writers hold it alone.
+    Waiting writers block new readers, so a steady stream of searches cannot starve a write.
+    Not reentrant; a thread holding the read side must not acquire it again while a writer may be waiting.
+    """
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0 # Threads currently holding the read side.
+        self.writer = False # Whether a writer currently holds the lock.
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        with self.cond:
+            while self.writer or self.waiting_writers:
+                self.cond.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.cond:
+            self.readers -= 1
+            if not self.readers:
+                self.cond.notify_all()
+
+    def acquire_write(self):
+        with self.cond:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.cond.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+
+    def release_write(self):
+        with self.cond:
+            self.writer = False
+            self.cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
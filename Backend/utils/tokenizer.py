@@ -0,0 +1,40 @@
+from typing import List, Optional, Set
+import re
+
+# Common English function words that carry little ranking signal.
+ENGLISH_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "he", "her", "his",
+    "i", "if", "in", "into", "is", "it", "its", "of", "on", "or", "our", "she", "so", "that", "the", "their",
+    "them", "then", "there", "these", "they", "this", "to", "was", "we", "were", "what", "when", "where",
+    "which", "who", "will", "with", "you", "your",
+}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Light suffix stripping, longest suffix first. Not a full Porter stemmer, but it folds the common inflections.
+_SUFFIXES = ("ational", "ization", "fulness", "ousness", "iveness", "ations", "ation", "ments", "ment", "ness", "ings", "ing", "edly", "ies", "ied", "ers", "er", "ed", "ly", "es", "s")
+
+def stem(token : str) -> str:
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            root = token[:-len(suffix)]
+            return root + "y" if suffix in ("ies", "ied") else root
+    return token
+
+class Tokenizer:
+    """
+    Lowercases text and splits it on non-word characters (so punctuation is dropped),
+    optionally removing stopwords and stemming each token.
+    """
+    def __init__(self, remove_stopwords : bool = True, use_stemming : bool = False, stopwords : Optional[Set[str]] = None):
+        self.remove_stopwords = remove_stopwords
+        self.use_stemming = use_stemming
+        self.stopwords = ENGLISH_STOPWORDS if stopwords is None else stopwords
+
+    def __call__(self, text : str) -> List[str]:
+        tokens = _WORD.findall(text.lower())
+        if self.remove_stopwords:
+            tokens = [token for token in tokens if token not in self.stopwords]
+        if self.use_stemming:
+            tokens = [stem(token) for token in tokens]
+        return tokens
@@ -0,0 +1,10 @@
+from typing import List
+from pydantic import Field
+
+from .query_request import SearchOptions, ResultField
+
+MAX_BATCH_QUERIES = 256 # Bounds the encoder work and the (queries x candidates) scoring of a single request.
+
+class BatchQueryRequest(SearchOptions):
+    queries: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES, description="The input texts to search for. Results are returned in the same order.")
+    fields: List[ResultField] = Field(default = ["id", "document_id", "text", "score"], description="Fields included in each result.")
\ No newline at end of file
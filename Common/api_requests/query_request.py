@@ -1,6 +1,30 @@
+from typing import Optional, Literal, Dict, List, Union
 from pydantic import BaseModel, Field
 
+MAX_TOP_K = 1000 # Bounds the candidates, scoring and serialization a single query can ask for.
+
+ResultField = Literal["id", "document_id", "library_id", "text", "metadata", "embeddings", "score", "scores"]
+
+class SearchOptions(BaseModel):
+    '''
+    Result count, engine tuning, scope and filters shared by single and batch searches.
+    '''
+    top_k: int = Field(5, ge=1, le=MAX_TOP_K, description="The number of top similar chunks to return")
+    probe_radius: Optional[int] = Field(None, ge=0, description="LSH: Hamming distance of neighbouring buckets to probe. Higher values raise recall and candidate count. Defaults to the index setting.")
+    num_tables: Optional[int] = Field(None, ge=1, description="LSH: number of hash tables to query. Defaults to all tables.")
+    ef_search: Optional[int] = Field(None, ge=1, description="HNSW: size of the search beam. Higher values raise recall and latency. Defaults to the index setting.")
+    nprobe: Optional[int] = Field(None, ge=1, description="IVF-PQ: number of inverted lists to scan. Defaults to the index setting.")
+    rerank: bool = Field(True, description="IVF-PQ: re-rank the compressed candidates with exact similarities.")
+    exact: bool = Field(False, description="Score every chunk in scope exactly (flat engine) instead of using each library's engine. Full recall; cost grows linearly with chunk count.")
+    library_id: Optional[str] = Field(None, description="Only search this library's chunks.")
+    document_id: Optional[str] = Field(None, description="Only search this document's chunks.")
+    filters: Dict[str, Union[str, List[str]]] = Field(default = {}, description="Metadata filters. A string value requires equality, a list matches any of its values. Chunks inherit their document's metadata.")
+
 # TODO: Add query API using this request.
-class QueryRequest(BaseModel):
+class QueryRequest(SearchOptions):
     query: str = Field(..., description="The input text to search for")
-    top_k: int = Field(5, description="The number of top similar chunks to return")
\ No newline at end of file
+    mode: Literal["semantic", "keyword", "hybrid"] = Field("semantic", description="Retriever(s) to use. Hybrid runs semantic and keyword search concurrently and fuses their rankings.")
+    fusion: Literal["rrf", "weighted"] = Field("rrf", description="Hybrid: reciprocal rank fusion, or a weighted sum of min-max normalized scores.")
+    semantic_weight: float = Field(0.5, ge=0, le=1, description="Hybrid (weighted fusion): weight of the semantic score; the keyword score gets 1 - semantic_weight.")
+    rrf_k: int = Field(60, ge=1, description="Hybrid (rrf fusion): rank offset k in 1 / (k + rank).")
+    fields: Optional[List[ResultField]] = Field(None, description="Fields included in each result, e.g. [\"id\", \"text\", \"score\"]. By default each result holds the chunk (without embeddings) and its score.")
\ No newline at end of file
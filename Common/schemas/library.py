@@ -1,5 +1,5 @@
 from uuid import uuid4
-from typing import List, Dict
+from typing import List, Dict, Literal
 from pydantic import BaseModel, Field
 
 from .document import Document
@@ -7,4 +7,5 @@ from .document import Document
 class Library(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid4()))
     documents : Dict[str, Document] = Field(default = {}, description="All documents within this library, mapped by doc_id.")
-    metadata: Dict[str, str]
\ No newline at end of file
+    metadata: Dict[str, str]
+    index_engine: Literal["lsh", "hnsw", "ivfpq", "flat"] = Field(default = "lsh", description="Semantic search engine used for this library's chunks.")
\ No newline at end of file
@@ -24,9 +24,17 @@ BASE_HEADERS = {"Content-Type": "application/json"}
 # REST helpers
 
 def fetch_libraries(api_url: str) -> List[Library]:
-    resp = requests.get(f"{api_url}/libraries", timeout=API_TIMEOUT)
-    resp.raise_for_status()
-    return [Library.parse_obj(d) for d in resp.json()]
+    libraries = []
+    params = {}
+    while True:
+        # Libraries are listed in pages; the next page's cursor comes back in a header.
+        resp = requests.get(f"{api_url}/libraries", params=params, timeout=API_TIMEOUT)
+        resp.raise_for_status()
+        libraries.extend(Library.parse_obj(d) for d in resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            return libraries
+        params = {"cursor": cursor}
 
 def fetch_library(lib_id: str, api_url: str) -> Library:
     resp = requests.get(f"{api_url}/libraries/{lib_id}", timeout=API_TIMEOUT)